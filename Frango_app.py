@@ -4,9 +4,16 @@ from tkinter import ttk
 from tkinter import simpledialog
 import json
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import csv
-from main import PrevisorDemanda
+import queue
+import threading
+from motor_simulacao import (
+    MotorSimulacao, ArquivoProcessos, SKU_DEFINITIONS, KNOWN_FILIAIS, STATUS_EM_ANDAMENTO,
+    ETAPA_DESABILITADA, ETAPA_AGUARDANDO, ETAPA_FEITA, NOMES_STATUS_ETAPA, QUANTIDADE_PADRAO_KG,
+)
+# `main` (pandas, NumPy e o modelo) é importado numa thread em segundo plano depois que a
+# tela de login aparece; até lá as previsões vêm da tabela pré-calculada em sku_quantities.json.
 
 # --- INÍCIO DA CORREÇÃO ---
 # Garante que os caminhos para os arquivos de dados sejam absolutos,
@@ -20,57 +27,168 @@ USERS_FILE = os.path.join(script_dir, "users.json")
 SKU_QUANTITIES_FILE = os.path.join(script_dir, "sku_quantities.json")
 # Nome do arquivo de Log para registrar eventos
 LOG_FILE = os.path.join(script_dir, "log_movimentacoes.csv")
+# Arquivo (JSON Lines) dos processos concluídos que saíram da memória (ver ArquivoProcessos)
+PROCESS_ARCHIVE_FILE = os.path.join(script_dir, "processos_arquivados.jsonl")
 # --- FIM DA CORREÇÃO ---
 
-# Inicialize o previsor de demanda
-previsor = PrevisorDemanda(script_dir)
+# Previsor de demanda: criado e carregado na primeira necessidade (ver carregar_previsor).
+# O PrevisorDemanda não é thread-safe (cache LRU de previsões, histórico montado sob
+# demanda): a carga e todo uso passam pela trava, reentrante para que usar_previsor possa
+# carregá-lo.
+previsor = None
+trava_previsor = threading.RLock()
+# Dias cujos processos foram gerados com previsões provisórias (tabela de outro dia ou
+# quantidade padrão) enquanto o modelo carregava; recalculados em ao_carregar_previsor
+dias_com_previsao_provisoria = set()
+
+def carregar_previsor():
+    """
+    Importa `main`, carrega os dados de vendas e o modelo e publica o previsor global, uma
+    única vez. O modelo só é re-treinado se o cache (modelo_demanda/) estiver desatualizado.
+    Pode ser chamada de uma thread em segundo plano.
+    """
+    global previsor
+    with trava_previsor:
+        if previsor is not None:
+            return previsor
+        from main import PrevisorDemanda
+        vendas_path = os.path.join(script_dir, "dados_vendas.csv")  # ajuste o nome se necessário
+        if not os.path.exists(vendas_path):
+            raise FileNotFoundError(f"Arquivo de vendas não encontrado: {vendas_path}")
+        novo_previsor = PrevisorDemanda(script_dir)
+        novo_previsor.carregar_dados_vendas(vendas_path)
+        novo_previsor.preparar_features()
+        novo_previsor.carregar_ou_treinar_modelo()
+        if os.path.exists(novo_previsor.caminho_registro_particoes()):
+            # Modelos por filial/SKU gerados com `python main.py --particionado ...`; se o
+            # registro estiver desatualizado, as previsões usam só o modelo global
+            try:
+                novo_previsor.carregar_modelos_particionados()
+            except ValueError as e:
+                print(f"Modelos particionados não carregados: {e}")
+        previsor = novo_previsor
+        return previsor
+
+def usar_previsor(funcao):
+    """Executa `funcao(previsor)` sob a trava do previsor, carregando-o se preciso."""
+    with trava_previsor:
+        return funcao(carregar_previsor())
+
+def previsoes_da_tabela(chaves):
+    """
+    Busca em sku_quantities.json as previsões das chaves (data_base, sku, filial). Chaves
+    sem previsão na tabela recebem QUANTIDADE_PADRAO_KG.
 
-def inicializar_json_com_previsoes_reais():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    dados_path = os.path.join(script_dir, 'dados_vendas.csv')
+    Returns:
+        tuple: (previsões, atualizadas); `atualizadas` é False se alguma previsão faltou ou
+        não foi calculada pelo modelo para o mesmo dia.
+    """
+    try:
+        with open(SKU_QUANTITIES_FILE, "r", encoding="utf-8") as f:
+            tabela = json.load(f)
+    except (OSError, ValueError):
+        tabela = {}
+    previsoes = []
+    atualizadas = True
+    for data_base, sku, filial in chaves:
+        entrada = tabela.get(str(filial), {}).get(str(sku))
+        if isinstance(entrada, dict) and "previsao" in entrada:
+            previsoes.append(entrada["previsao"])
+            if not str(entrada.get("data_previsao", "")).startswith(data_base.strftime("%Y-%m-%d")):
+                atualizadas = False
+        elif isinstance(entrada, (int, float)):
+            # Quantidade definida à mão em "Configurar Quantidades"
+            previsoes.append(entrada)
+            atualizadas = False
+        else:
+            previsoes.append(QUANTIDADE_PADRAO_KG)
+            atualizadas = False
+    return previsoes, atualizadas
+
+def quantidades_para_descongelamento(chaves):
+    """
+    Quantidade a descongelar para cada chave (data_base, sku, filial): a previsão pontual ou,
+    se NIVEL_SERVICO_DESCONGELAMENTO estiver definido, o percentil correspondente da demanda.
 
-    previsor = PrevisorDemanda(script_dir)
-    previsor.carregar_dados_vendas(dados_path)
-    previsor.preparar_features()
-    previsor.treinar_modelo()
+    Enquanto o modelo carrega, usa a tabela pré-calculada mesmo que seja de outro dia (sem
+    bloquear a interface); o dia fica marcado para ser recalculado quando o modelo estiver pronto.
+    """
+    if previsor is None:
+        previsoes, atualizadas = previsoes_da_tabela(chaves)
+        if not atualizadas or NIVEL_SERVICO_DESCONGELAMENTO is not None:
+            dias_com_previsao_provisoria.add(motor.dia_atual)
+        return previsoes
+    if NIVEL_SERVICO_DESCONGELAMENTO is None:
+        return usar_previsor(lambda p: p.prever_demanda_lote(chaves))
+    bandas = usar_previsor(lambda p: p.prever_quantis_lote(chaves, (NIVEL_SERVICO_DESCONGELAMENTO,)))
+    return bandas[:, 0].tolist()
+
+def carregar_previsor_em_segundo_plano():
+    """
+    Carrega o modelo e atualiza sku_quantities.json numa thread, sem travar a interface. A
+    thread não chama o Tk: o resultado é recolhido na thread da interface por
+    acompanhar_carga_previsor, agendado com after().
+    """
+    resultado = queue.Queue()
+    def carregar():
+        try:
+            carregar_previsor()
+            inicializar_json_com_previsoes_reais()
+            resultado.put(None)
+        except Exception as e:
+            resultado.put(e)
+    threading.Thread(target=carregar, daemon=True).start()
+    login_screen_ref.after(200, acompanhar_carga_previsor, resultado)
+
+def acompanhar_carga_previsor(resultado):
+    try:
+        erro = resultado.get_nowait()
+    except queue.Empty:
+        login_screen_ref.after(200, acompanhar_carga_previsor, resultado)
+        return
+    if erro is not None:
+        print(f"Erro ao carregar o previsor de demanda: {erro}")
+        messagebox.showerror("Previsão de Demanda", f"Não foi possível carregar o modelo de demanda:\n{erro}\n\nAs quantidades continuam vindo de sku_quantities.json.")
+        return
+    ao_carregar_previsor()
 
+def ao_carregar_previsor():
+    """Com o modelo pronto, recalcula os processos gerados com previsões provisórias e atualiza as telas."""
+    global sku_default_quantities
+    sku_default_quantities = load_sku_quantities()
+    for dia in sorted(dias_com_previsao_provisoria):
+        motor.reprever_quantidades(dia)
+    dias_com_previsao_provisoria.clear()
+    atualizar_telas_de_processos()
+
+def inicializar_json_com_previsoes_reais():
+    """Grava em sku_quantities.json as previsões do dia para todas as filiais e SKUs (sem chamar o Tk)."""
     data_base = datetime.now()
+    chaves = [(data_base, sku, filial) for filial in KNOWN_FILIAIS for sku in SKU_DEFINITIONS.keys()]
+    try:
+        previsoes = usar_previsor(lambda p: p.prever_demanda_lote(chaves))
+    except Exception as e:
+        print(f"Erro ao prever demanda em lote: {e}")
+        previsoes = [100.0] * len(chaves)
+
     novo_json = {}
-    for filial in KNOWN_FILIAIS:
+    for (_, sku, filial), previsao in zip(chaves, previsoes):
         if filial not in novo_json:
             novo_json[filial] = {}
-        for sku in SKU_DEFINITIONS.keys():
-            try:
-                previsao = previsor.prever_demanda(data_base, sku)
-                novo_json[filial][str(sku)] = {
-                    "previsao": previsao,
-                    "data_previsao": data_base.strftime("%Y-%m-%d %H:%M:%S")
-                }
-            except Exception as e:
-                print(f"Erro ao prever demanda para SKU {sku}: {e}")
-                novo_json[filial][str(sku)] = {
-                    "previsao": 100.0,
-                    "data_previsao": data_base.strftime("%Y-%m-%d %H:%M:%S")
-                }
+        novo_json[filial][str(sku)] = {
+            "previsao": previsao,
+            "data_previsao": data_base.strftime("%Y-%m-%d %H:%M:%S")
+        }
 
     with open(SKU_QUANTITIES_FILE, "w", encoding="utf-8") as f:
         json.dump(novo_json, f, indent=4, ensure_ascii=False)
     print("Previsões salvas com sucesso em formato por filial e SKU.")
 
-def inicializar_previsor():
-    vendas_path = os.path.join(script_dir, "dados_vendas.csv")  # ajuste o nome se necessário
-    if not os.path.exists(vendas_path):
-        messagebox.showerror("Erro", f"Arquivo de vendas não encontrado: {vendas_path}")
-        return
-    previsor.carregar_dados_vendas(vendas_path)
-    previsor.preparar_features()
-    previsor.treinar_modelo()
-    inicializar_json_com_previsoes_reais()
-    
 def atualizar_previsao_e_json(sku, data_base=None):
     if data_base is None:
         data_base = datetime.now()
-    previsao = previsor.prever_demanda(data_base, sku)
+    filial = logged_in_user_filial or "7"  # Use a filial do usuário logado ou padrão
+    previsao = usar_previsor(lambda p: p.prever_demanda(data_base, sku, filial=filial))
     timestamp = data_base.strftime("%Y-%m-%d %H:%M:%S")
     if os.path.exists(SKU_QUANTITIES_FILE):
         with open(SKU_QUANTITIES_FILE, "r", encoding="utf-8") as f:
@@ -78,8 +196,6 @@ def atualizar_previsao_e_json(sku, data_base=None):
     else:
         sku_quantities = {}
 
-    filial = logged_in_user_filial or "7"  # Use a filial do usuário logado ou padrão
-
     if filial not in sku_quantities:
         sku_quantities[filial] = {}
     sku_quantities[filial][sku] = {
@@ -99,111 +215,19 @@ def sugerir_quantidade_para_sku(sku):
 # --- Constantes de Lógica de Negócio ---
 BALCAO_CAPACITY = 20.0 # Capacidade recomendada do balcão em kg
 ALERT_THRESHOLD = 10.0 # Limite em kg para gerar alerta de reabastecimento
+# Percentil da demanda (ex.: 90) usado para dimensionar o descongelamento diário.
+# None usa a previsão pontual do modelo.
+NIVEL_SERVICO_DESCONGELAMENTO = None
 
 # --- Variáveis Globais de Dados ---
 users = {}
-generated_processes = []
-# Agora, filial_process_counters será aninhado: filial_process_counters[filial][sku]
-filial_process_counters = {}
-current_day = 0
-current_hour = 0
-end_of_day_cleanup_done_for_day = -1
 logged_in_user_filial = 7
-
-# #############################################################################
-# ############# INÍCIO DA SEÇÃO DE CÓDIGO ADICIONADO ##########################
-# #############################################################################
-# Define a data de início da simulação como o dia atual, à meia-noite.
-simulation_start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-# ###########################################################################
-# ############## FIM DA SEÇÃO DE CÓDIGO ADICIONADO ##########################
-# ###########################################################################
-
-# ... (o restante do seu código permanece o mesmo) ...
+# Relógio, processos e contadores da simulação (ver motor_simulacao.py); criado no fim do módulo
+motor = None
 
 # Dicionário para armazenar as quantidades padrão por SKU e Filial
 sku_default_quantities = {}
 
-# Dicionário para armazenar os processos que tiveram o Dia 2 concluído, por filial
-completed_day2_processes_by_filial = {}
-
-# --- Definição de SKUs com suas lógicas e rótulos de coluna ---
-SKU_DEFINITIONS = {
-    "237478": { # FILE DE PEITO FGO INTERF CONG KG
-        "days_cycle": 3,
-        "display_column_label": "FILE DE PEITO FGO",
-        "steps_descriptions": {
-            0: "237478 Peito de Frango: Retirado do congelador para estante de descongelamento inicial.",
-            1: "237478 Peito de Frango: Movido para estante intermediária de descongelamento.",
-            2: "237478 Peito de Frango: Pronto para embalagem/exposição."
-        }
-    },
-    "237479": { # ASA DE FGO INTERF CONG KG
-        "days_cycle": 3,
-        "display_column_label": "ASA DE FGO",
-        "steps_descriptions": {
-            0: "237479 Asa de Frango: Retirada do congelador para estante 1 do armazém.",
-            1: "237479 Asa de Frango: Movida para estante de descongelamento esquerda para a central.",
-            2: "237479 Asa de Frango: Movida para estante central para a direita (pronta para exposição)."
-        }
-    },
-    "237496": { # CORACAO DE FGO INTERF CONG KG
-        "days_cycle": 3,
-        "display_column_label": "CORACAO DE FGO",
-        "steps_descriptions": {
-            0: "237496 Coração de Frango: Retirado do congelador para estante de descongelamento inicial.",
-            1: "237496 Coração de Frango: Movido para estante intermediária de descongelamento.",
-            2: "237496 Coração de Frango: Pronto para embalagem/exposição."
-        }
-    },
-    "237497": { # COXA C/SOB FGO INTERF CONG KG
-        "days_cycle": 3,
-        "display_column_label": "COXA C/SOB FGO",
-        "steps_descriptions": {
-            0: "237497 Coxa c/ Sobrecoxa: Retirada do congelador e movida para área inicial de descongelamento.",
-            1: "237497 Coxa c/ Sobrecoxa: Movida para área intermediária de descongelamento.",
-            2: "237497 Coxa c/ Sobrecoxa: Movida para área final, pronto para exposição."
-        }
-    },
-    "237506": { # COXA DE FGO INTERF CONG KG
-        "days_cycle": 3,
-        "display_column_label": "COXA DE FGO",
-        "steps_descriptions": {
-            0: "237506 Coxa de Frango: Retirada do congelador e movida para área inicial de descongelamento.",
-            1: "237506 Coxa de Frango: Movida para área intermediária de descongelamento.",
-            2: "237506 Coxa de Frango: Movido para área final, pronto para exposição."
-        }
-    },
-    "237508": { # COXINHA DA ASA FGO INTERF CONG KG
-        "days_cycle": 3,
-        "display_column_label": "COXINHA DA ASA FGO",
-        "steps_descriptions": {
-            0: "237508 Coxinha da Asa: Retirada do congelador para estante de descongelamento inicial.",
-            1: "237508 Coxinha da Asa: Movida para estante intermediária de descongelamento.",
-            2: "237508 Coxinha da Asa: Pronto para embalagem/exposição."
-        }
-    },
-    "237511": { # MOELA DE FRANGO INTERF CONG KG
-        "days_cycle": 3,
-        "display_column_label": "MOELA DE FRANGO",
-        "steps_descriptions": {
-            0: "237511 Moela de Frango: Retirada do congelador para estante de descongelamento inicial.",
-            1: "237511 Moela de Frango: Movido para estante intermediária de descongelamento.",
-            2: "237511 Moela de Frango: Pronto para embalagem/exposição."
-        }
-    },
-    "384706": { # PE FRANGO INTERF CONG KG
-        "days_cycle": 3,
-        "display_column_label": "PE FRANGO",
-        "steps_descriptions": {
-            0: "384706 Pé de Frango: Retirado do congelador para estante de descongelamento inicial.",
-            1: "384706 Pé de Frango: Movido para estante intermediária de descongelamento.",
-            2: "384706 Pé de Frango: Pronto para embalagem/exposição."
-        }
-    }
-}
-KNOWN_FILIAIS = ["7", "8", "9", "10"]
-
 # --- Variáveis Globais de Referência de Janelas ---
 login_screen_ref = None
 manager_window = None
@@ -215,6 +239,9 @@ comprador_window = None
 controller_window = None
 sku_quantity_config_window = None
 
+# Re-treino do modelo em andamento (TreinamentoEmSegundoPlano) ou None
+retreinamento_em_andamento = None
+
 open_movimentador_windows = []
 open_abastecedor_windows = []
 
@@ -272,8 +299,7 @@ def get_current_simulated_datetime():
     Calcula o datetime simulado atual com base na data de início da simulação,
     o dia atual e a hora atual da simulação.
     """
-    global simulation_start_date, current_day, current_hour
-    return simulation_start_date + timedelta(days=current_day, hours=current_hour)
+    return motor.data_simulada()
 
 # ###########################################################################
 # ############## INÍCIO DA FUNÇÃO CORRIGIDA #################################
@@ -282,7 +308,7 @@ def gerar_relatorio_abastecimento(process_id):
     """
     Gera um relatório CSV com abastecimentos e compras detalhados, atualizando estoque e balcão em tempo real.
     """
-    process = next((p for p in generated_processes if p['sku_process_number'] == process_id), None)
+    process = motor.consultar_processo(process_id)
     if not process:
         print(f"Processo {process_id} não encontrado.")
         return
@@ -300,10 +326,10 @@ def gerar_relatorio_abastecimento(process_id):
             "Estoque_Atual_Kg", "Valor_no_Balcao_Kg", "Sobras_Totais_Kg"
         ]
 
-        filial = process.get("filial")
-        sku = process.get("sku")
+        filial = process.filial
+        sku = process.sku
         descricao = SKU_DEFINITIONS.get(sku, {}).get("display_column_label", "N/A")
-        quantidade_inicial = process.get("quantidade_inicial_kg", 0.0)
+        quantidade_inicial = process.quantidade_inicial_kg
 
         # Inicializa valores
         estoque = quantidade_inicial
@@ -311,7 +337,7 @@ def gerar_relatorio_abastecimento(process_id):
 
         # Carrega abastecimentos
         eventos = []
-        for log in process.get("replenishment_log", []):
+        for log in process.replenishment_log or []:
             eventos.append({
                 "timestamp": log["timestamp"],
                 "usuario": log["usuario"],
@@ -396,20 +422,18 @@ def gerar_relatorio_consolidado_filial7():
             ])
 
         report_data = []
-        for process in generated_processes:
-            if process.get("filial") != "7":
-                continue
+        for process in motor.consultar(filial="7"):
 
             # --- CORREÇÃO PRINCIPAL ---
             # Lê o valor do campo 'quantidade_inicial_kg' salvo no próprio processo.
             # Este valor é o registro histórico da criação do processo.
-            quantidade_historica = process.get('quantidade_inicial_kg', 0.0)
+            quantidade_historica = process.quantidade_inicial_kg
 
             row_data = {
-                "ID_Processo": process.get("sku_process_number"),
-                "Filial": process.get("filial"),
-                "SKU": process.get("sku"),
-                "Descricao_SKU": SKU_DEFINITIONS.get(process.get("sku"), {}).get("display_column_label", "N/A"),
+                "ID_Processo": process.sku_process_number,
+                "Filial": process.filial,
+                "SKU": process.sku,
+                "Descricao_SKU": SKU_DEFINITIONS.get(process.sku, {}).get("display_column_label", "N/A"),
                 # Usa a quantidade histórica para o relatório.
                 "Quantidade_Inicial_Kg": f"{quantidade_historica:.2f}",
             }
@@ -417,9 +441,8 @@ def gerar_relatorio_consolidado_filial7():
             # --- CORREÇÃO NO CÁLCULO ---
             # Os cálculos de peso para os dias seguintes agora são baseados
             # na quantidade_historica, garantindo a consistência do relatório.
-            for day_offset in range(process.get("days_cycle", 3)):
-                absolute_step_day = process["dia_geracao"] + day_offset
-                step_info = process["steps_status"].get(str(absolute_step_day), {})
+            for day_offset in range(process.days_cycle):
+                movimentacao = process.movimentacao(day_offset)
 
                 # Calcula o peso para cada dia baseado no valor HISTÓRICO
                 peso_dia = 0.0
@@ -433,14 +456,14 @@ def gerar_relatorio_consolidado_filial7():
                     peso_dia = quantidade_historica * (1 - 0.15)
 
                 # Formata os dados
-                start_ts = step_info.get('inicio_movimentacao_ts')
-                confirm_ts = step_info.get('confirmacao_movimentacao_ts')
+                start_ts = movimentacao.inicio_ts if movimentacao else None
+                confirm_ts = movimentacao.confirmacao_ts if movimentacao else None
 
                 row_data[f"Idade_Dia_{day_offset}"] = day_offset
                 row_data[f"Peso_Dia_{day_offset}"] = f"{peso_dia:.2f}"
                 row_data[f"Inicio_Movimentacao_Dia_{day_offset}"] = start_ts.strftime("%Y-%m-%d %H:%M:%S") if start_ts else ""
                 row_data[f"Confirmacao_Movimentacao_Dia_{day_offset}"] = confirm_ts.strftime("%Y-%m-%d %H:%M:%S") if confirm_ts else ""
-                row_data[f"Responsavel_Dia_{day_offset}"] = step_info.get("responsavel_movimentacao", "")
+                row_data[f"Responsavel_Dia_{day_offset}"] = movimentacao.responsavel if movimentacao else ""
 
             report_data.append(row_data)
 
@@ -493,31 +516,14 @@ def load_sku_quantities():
                 return new_data.get(logged_in_user_filial, {})
             else:
                 return data.get(logged_in_user_filial, {})
-    # Se não existe, inicializa com previsão e recarrega
-    inicializar_json_com_previsoes_reais()
-    with open(SKU_QUANTITIES_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        return data.get(logged_in_user_filial, {})
+    # Se não existe, é gravado pela carga do modelo em segundo plano (ver ao_carregar_previsor)
+    return {}
 
 
 def save_sku_quantities(quantities_data):
     with open(SKU_QUANTITIES_FILE, 'w', encoding='utf-8') as f:
         json.dump(quantities_data, f, indent=4)
 
-users = load_users()
-sku_default_quantities = load_sku_quantities()
-
-def initialize_filial_counters():
-    global filial_process_counters, completed_day2_processes_by_filial
-    for filial in KNOWN_FILIAIS:
-        filial_process_counters[filial] = {}
-        completed_day2_processes_by_filial[filial] = []
-    for filial in KNOWN_FILIAIS:
-        for sku_key in SKU_DEFINITIONS.keys():
-            filial_process_counters[filial][sku_key] = 0
-
-initialize_filial_counters()
-
 # --- Funções Auxiliares para Gerenciamento de Janelas ---
 def show_placeholder_message(feature_name):
     messagebox.showinfo("Funcionalidade em Desenvolvimento", f"A funcionalidade '{feature_name}' ainda será implementada.")
@@ -551,204 +557,42 @@ def on_toplevel_close(window, window_ref_var_name, allow_multiple=False, window_
     window.destroy()
 
 # --- Funções de Processamento de Lógica de Negócio ---
-
-# ###########################################################################
-# ############## INÍCIO DA SEÇÃO DE CÓDIGO MODIFICADO #######################
-# ###########################################################################
-def generate_new_process(sku, quantidade_kg, filial_processo):
-    global filial_process_counters
-
-    if sku not in SKU_DEFINITIONS:
-        print(f"Erro: SKU '{sku}' não encontrado nas definições. Pulando a geração do processo.")
-        return
-
-    if filial_processo not in filial_process_counters:
-        filial_process_counters[filial_processo] = {}
-    if sku not in filial_process_counters[filial_processo]:
-        filial_process_counters[filial_processo][sku] = 0
-
-    filial_process_counters[filial_processo][sku] += 1
-
-    sku_process_number = f"{sku}-{filial_process_counters[filial_processo][sku]}-{filial_processo}"
-
-    sku_config = SKU_DEFINITIONS[sku]
-
-    steps_status = {}
-    for day_offset in range(sku_config["days_cycle"]):
-        absolute_step_day = current_day + day_offset
-        steps_status[str(absolute_step_day)] = {
-            "status": "Desabilitado",
-            "movimentacao_started": False,
-            "data_movimentacao": None
-        }
-
-    new_process = {
-        "numero": f"{filial_process_counters[filial_processo][sku]}-{filial_processo}",
-        "sku_process_number": sku_process_number,
-        "dia_geracao": current_day,
-        "hora_criacao": current_hour,
-        "sku": sku,
-        "quantidade_inicial_kg": quantidade_kg,
-        "quantidade_kg": quantidade_kg,
-        "peso_no_balcao": 0.0,
-        "filial": filial_processo,
-        "days_cycle": sku_config["days_cycle"],
-        "steps_descriptions": sku_config["steps_descriptions"],
-        "steps_status": steps_status,
-        "replenishment_log": []
-    }
-    generated_processes.append(new_process)
-    print(f"Processo {sku_process_number} (Dia {current_day} - Hora {current_hour:02d}:00, SKU {sku}, Qty {quantidade_kg} kg) gerado com sucesso! Todos os passos iniciais: Desabilitado")
-
-    log_event(
-        evento="PROCESSO CRIADO",
-        filial=filial_processo,
-        sku=sku,
-        process_id=sku_process_number,
-        dia_processo="N/A",
-        quantidade_kg=quantidade_kg,
-        usuario="SISTEMA"
+# As regras (geração, estados, fim de expediente, relógio) ficam no MotorSimulacao; aqui
+# ficam os avisos ao usuário e a atualização das janelas.
+
+def registrar_sobra(filial, process_data, sobra_estante, sobra_balcao):
+    sku_label = SKU_DEFINITIONS[process_data.sku]['display_column_label']
+    message = (
+        f"Filial {filial} - Recolher Sobras:\n\n"
+        f"Produto: {sku_label} (Processo: {process_data.sku_process_number})\n"
+        f"---------------------------------------------------\n"
+        f"Sobra na Estante: {sobra_estante:.2f} kg\n"
+        f"Sobra no Balcão: {sobra_balcao:.2f} kg\n"
+        f"---------------------------------------------------\n"
+        f"TOTAL A RECOLHER: {sobra_estante + sobra_balcao:.2f} kg\n\n"
+        "Pedido enviado ao setor de alimentos para preparo."
     )
-# ###########################################################################
-# ############## FIM DA SEÇÃO DE CÓDIGO MODIFICADO ##########################
-# ###########################################################################
-
-def perform_daily_process_generation():
-    global sku_default_quantities
-    print(f"\n--- Gerando processos para o Dia {current_day} (00:00) ---")
+    messagebox.showinfo("Fim de Expediente - Registro de Sobras", message)
 
-    for filial in KNOWN_FILIAIS:
-        for sku in SKU_DEFINITIONS.keys():
-            data_base = get_current_simulated_datetime()
-            quantidade = previsor.prever_demanda(data_base, sku)
-            generate_new_process(sku, quantidade, filial)
-
-    print(f"--- Geração de processos diária concluída para o Dia {current_day} ---")
-
-def update_process_states_on_time_change():
-    print(f"\n--- Verificando e atualizando estados dos processos (Dia {current_day} Hora {current_hour:02d}:00) ---")
-    for process in generated_processes:
-        total_days_cycle = process.get("days_cycle", 3)
-
-        for day_offset in range(total_days_cycle):
-            absolute_step_day = process["dia_geracao"] + day_offset
-
-            previous_step_status_completed = False
-            if day_offset == 0:
-                previous_step_status_completed = True
-            else:
-                previous_absolute_step_day = process["dia_geracao"] + (day_offset - 1)
-                prev_step_info = process["steps_status"].get(str(previous_absolute_step_day))
-                if prev_step_info and prev_step_info["status"] == "Feito":
-                    previous_step_status_completed = True
-
-            current_step_info = process["steps_status"].get(str(absolute_step_day))
-
-            if not current_step_info:
-                process["steps_status"][str(absolute_step_day)] = {
-                    "status": "Desabilitado", "movimentacao_started": False, "data_movimentacao": None
-                }
-                current_step_info = process["steps_status"][str(absolute_step_day)]
-
-            activation_condition_met = False
-            if previous_step_status_completed:
-                if current_day > absolute_step_day:
-                    activation_condition_met = True
-                elif current_day == absolute_step_day:
-                    if current_hour >= 6:
-                        activation_condition_met = True
-
-            if activation_condition_met:
-                if current_step_info["status"] == "Desabilitado":
-                    current_step_info["status"] = "Aguardando"
-                    current_step_info["movimentacao_started"] = False
-                    print(f"Processo {process['sku_process_number']} - Etapa Dia {day_offset} (Absoluto {absolute_step_day}) ATIVADA para AGUARDANDO no Dia {current_day} Hora {current_hour:02d}:00.")
-            else:
-                if current_step_info["status"] == "Aguardando":
-                    current_step_info["status"] = "Desabilitado"
-                    current_step_info["movimentacao_started"] = False
-                    print(f"Processo {process['sku_process_number']} - Etapa Dia {day_offset} (Absoluto {absolute_step_day}) voltou para DESABILITADO no Dia {current_day} Hora {current_hour:02d}:00.")
-    print("--- Verificação e atualização de estados concluída ---")
-
-# ###########################################################################
-# ############## INÍCIO DA SEÇÃO DE CÓDIGO MODIFICADO #######################
-# ###########################################################################
-def handle_end_of_day_cleanup():
-    """Rotina de fim de expediente (18:00) para registrar sobras, gerar relatórios e limpar a tela."""
-    global end_of_day_cleanup_done_for_day, completed_day2_processes_by_filial
-
-    print(f"--- Iniciando Rotina de Fim de Expediente (Dia {current_day}) ---")
-
-    processes_to_remove_by_filial = {}
-    any_leftovers = False
-
-    for filial, process_ids in list(completed_day2_processes_by_filial.items()):
-        processes_to_remove_by_filial[filial] = []
-
-        for process_id in process_ids:
-            process_data = next((p for p in generated_processes if p['sku_process_number'] == process_id), None)
-
-            if process_data:
-                sobra_estante = process_data['quantidade_kg']
-                sobra_balcao = process_data.get('peso_no_balcao', 0.0)
-                total_sobra = sobra_estante + sobra_balcao
-
-                if total_sobra > 0:
-                    any_leftovers = True
-                    sku_label = SKU_DEFINITIONS[process_data['sku']]['display_column_label']
-                    message = (
-                        f"Filial {filial} - Recolher Sobras:\n\n"
-                        f"Produto: {sku_label} (Processo: {process_id})\n"
-                        f"---------------------------------------------------\n"
-                        f"Sobra na Estante: {sobra_estante:.2f} kg\n"
-                        f"Sobra no Balcão: {sobra_balcao:.2f} kg\n"
-                        f"---------------------------------------------------\n"
-                        f"TOTAL A RECOLHER: {total_sobra:.2f} kg\n\n"
-                        "Pedido enviado ao setor de alimentos para preparo."
-                    )
-                    messagebox.showinfo("Fim de Expediente - Registro de Sobras", message)
-                    print(f"Filial {filial}: Registrado sobra de {total_sobra:.2f} kg para o processo {process_id}.")
-
-                # --- ADICIONADO: Gatilho para gerar o relatório de abastecimento ---
-                gerar_relatorio_abastecimento(process_id)
-
-                processes_to_remove_by_filial[filial].append(process_id)
-
-    for filial, ids_to_remove in processes_to_remove_by_filial.items():
-        if filial in completed_day2_processes_by_filial:
-            current_list = completed_day2_processes_by_filial[filial]
-            completed_day2_processes_by_filial[filial] = [pid for pid in current_list if pid not in ids_to_remove]
-            print(f"Filial {filial}: Removidos {len(ids_to_remove)} processos da tela de abastecimento.")
-
-    if not any_leftovers:
+def concluir_fim_de_expediente(houve_sobras):
+    if not houve_sobras:
         messagebox.showinfo("Fim de Expediente", "Rotina de fim de dia executada. Não houve sobras para registrar.")
-
-    end_of_day_cleanup_done_for_day = current_day
-
     for win in open_abastecedor_windows:
         update_abastecedor_completed_processes_display(win)
 
-    print("--- Rotina de Fim de Expediente Concluída ---")
-# ###########################################################################
-# ############## FIM DA SEÇÃO DE CÓDIGO MODIFICADO ##########################
-# ###########################################################################
-
-def check_for_time_based_events():
-    """Verifica se algum evento baseado em tempo deve ser acionado."""
-    global end_of_day_cleanup_done_for_day
-
-    # Se o dia mudou, reseta a flag de limpeza
-    if current_day > end_of_day_cleanup_done_for_day:
-        end_of_day_cleanup_done_for_day = -1
-
-    # Aciona a limpeza de fim de dia às 18:00 ou depois, mas apenas uma vez por dia
-    if current_hour >= 18 and end_of_day_cleanup_done_for_day != current_day:
-        print(f"Acionando rotina de fim de expediente para o Dia {current_day}.")
-        handle_end_of_day_cleanup()
+def atualizar_janelas_apos_avanco():
+    if controller_window and controller_window.winfo_exists():
+        controller_window.day_label.config(text=f"Dia Atual: {motor.dia_atual}")
+        controller_window.hour_label.config(text=f"Hora Atual: {motor.hora_atual:02d}:00")
 
+def atualizar_telas_de_processos():
+    for win in open_movimentador_windows:
+        update_movimentador_processes(win)
+    for win in open_abastecedor_windows:
+        update_abastecedor_completed_processes_display(win)
+    update_controller_weight_panel()
 
 def advance_x_hours():
-    global current_hour, current_day
     try:
         hours_to_advance = int(controller_window.hour_jump_entry.get().strip())
         if hours_to_advance <= 0:
@@ -758,52 +602,18 @@ def advance_x_hours():
         messagebox.showerror("Avançar Horas", "Por favor, insira um número inteiro válido de horas.")
         return
 
-    for _ in range(hours_to_advance):
-        current_hour += 1
-        if current_hour >= 24:
-            current_hour = 0
-            current_day += 1
-            perform_daily_process_generation()
-        # Chama a verificação de eventos a cada hora avançada
-        check_for_time_based_events()
-
-    if controller_window and controller_window.winfo_exists():
-        controller_window.day_label.config(text=f"Dia Atual: {current_day}")
-        controller_window.hour_label.config(text=f"Hora Atual: {current_hour:02d}:00")
-
-    messagebox.showinfo("Avanço de Tempo", f"A hora foi avançada para {current_hour:02d}:00 do Dia {current_day}.")
-
-    update_process_states_on_time_change()
-    for win in open_movimentador_windows:
-        update_movimentador_processes(win)
-    for win in open_abastecedor_windows:
-        update_abastecedor_completed_processes_display(win)
-
-    update_controller_weight_panel()
+    motor.avancar_horas(hours_to_advance)
+    atualizar_janelas_apos_avanco()
+    messagebox.showinfo("Avanço de Tempo", f"A hora foi avançada para {motor.hora_atual:02d}:00 do Dia {motor.dia_atual}.")
+    atualizar_telas_de_processos()
 
 
 def advance_day_complete():
-    global current_day, current_hour
-
     # Roda a limpeza do dia atual antes de avançar para o próximo
-    check_for_time_based_events()
-
-    current_day += 1
-    current_hour = 0
-    perform_daily_process_generation()
-
-    if controller_window and controller_window.winfo_exists():
-        controller_window.day_label.config(text=f"Dia Atual: {current_day}")
-        controller_window.hour_label.config(text=f"Hora Atual: {current_hour:02d}:00")
-    messagebox.showinfo("Avanço de Dia", f"O dia foi avançado para o Dia {current_day} (00:00).")
-
-    update_process_states_on_time_change()
-    for win in open_movimentador_windows:
-        update_movimentador_processes(win)
-    for win in open_abastecedor_windows:
-        update_abastecedor_completed_processes_display(win)
-
-    update_controller_weight_panel()
+    motor.avancar_dia()
+    atualizar_janelas_apos_avanco()
+    messagebox.showinfo("Avanço de Dia", f"O dia foi avançado para o Dia {motor.dia_atual} (00:00).")
+    atualizar_telas_de_processos()
 # --- Lógica de Login ---
 # ###########################################################################
 # ############## INÍCIO DA SEÇÃO DE CÓDIGO MODIFICADO #######################
@@ -940,7 +750,7 @@ def open_register_user_interface(parent_screen):
 # ###########################################################################
 def start_abastecimento_process(process_id, window_ref):
     """Gerencia o fluxo de reabastecimento do balcão para um processo."""
-    process_data = next((p for p in generated_processes if p['sku_process_number'] == process_id), None)
+    process_data = motor.processo(process_id)
     if not process_data:
         messagebox.showerror("Erro", f"Processo {process_id} não encontrado.")
         return
@@ -948,9 +758,9 @@ def start_abastecimento_process(process_id, window_ref):
     # MODIFICADO: Recupera o usuário da janela que iniciou a ação
     current_user = window_ref.current_user
 
-    estoque_atual = process_data['quantidade_kg']
-    peso_no_balcao = process_data['peso_no_balcao']
-    sku_info = SKU_DEFINITIONS.get(process_data['sku'], {})
+    estoque_atual = process_data.quantidade_kg
+    peso_no_balcao = process_data.peso_no_balcao
+    sku_info = SKU_DEFINITIONS.get(process_data.sku, {})
     display_name = sku_info.get('display_column_label', 'SKU Desconhecido')
 
     if estoque_atual <= 0:
@@ -981,41 +791,15 @@ def start_abastecimento_process(process_id, window_ref):
     if quantidade_levada is None:
         return
 
-    if quantidade_levada > estoque_atual:
-        messagebox.showerror(
-            "Erro de Validação",
-            f"A quantidade informada ({quantidade_levada:.2f} kg) é maior que o estoque disponível na estante ({estoque_atual:.2f} kg).\n"
-            "Ação cancelada."
-        )
+    try:
+        motor.abastecer(process_id, quantidade_levada, current_user)
+    except ValueError as e:
+        messagebox.showerror("Erro de Validação", f"{e}\nAção cancelada.")
         return
 
-    # Atualizar dados do processo
-    process_data['quantidade_kg'] -= quantidade_levada
-    process_data['peso_no_balcao'] += quantidade_levada
-
-    # --- ADICIONADO: Registro do abastecimento no log do processo ---
-    log_entry = {
-        "usuario": current_user,
-        "timestamp": get_current_simulated_datetime(),
-        "quantidade_abastecida": quantidade_levada
-    }
-    process_data['replenishment_log'].append(log_entry)
-
-    # --- ADICIONADO: Log geral do evento de abastecimento ---
-    log_event(
-        evento="ABASTECIMENTO",
-        filial=process_data['filial'],
-        sku=process_data['sku'],
-        process_id=process_id,
-        dia_processo="N/A", # Abastecimento não tem dia de ciclo
-        quantidade_kg=quantidade_levada, # Loga a quantidade que foi movida
-        usuario=current_user,
-        info_adicional=f"Abastecimento do balcão. Saldo estante: {process_data['quantidade_kg']:.2f}kg, Saldo balcão: {process_data['peso_no_balcao']:.2f}kg"
-    )
-
     messagebox.showinfo("Sucesso", f"Abastecimento de {quantidade_levada:.2f} kg registrado com sucesso!")
 
-    if process_data['quantidade_kg'] <= 0:
+    if process_data.quantidade_kg <= 0:
         messagebox.showinfo("Estoque da Estante Esgotado", f"O estoque da estante do processo {process_id} foi totalmente utilizado. O card ficará azul até o fim do expediente.")
         print(f"Processo {process_id} teve seu estoque da estante esgotado, mas permanecerá visível.")
 
@@ -1034,26 +818,25 @@ def update_abastecedor_completed_processes_display(window_ref):
         widget.destroy()
 
     filial_desta_janela = window_ref.current_logged_in_filial
-    process_ids_for_display = completed_day2_processes_by_filial.get(filial_desta_janela, [])
+    process_ids_for_display = motor.concluidos_por_filial.get(filial_desta_janela, [])
 
     if not process_ids_for_display:
         tk.Label(window_ref.completed_display_frame, text="Nenhum processo pronto para abastecimento nesta filial.",
                  font=("Arial", 10), wraplength=350).pack(pady=10)
         return
 
-    process_objects = {p['sku_process_number']: p for p in generated_processes}
     cards_container = tk.Frame(window_ref.completed_display_frame)
     cards_container.pack(fill="x", pady=5, padx=5)
 
     display_count = 0
     for process_id in sorted(process_ids_for_display):
-        process_data = process_objects.get(process_id)
+        process_data = motor.processo(process_id)
         if not process_data:
             continue
 
         card_bg_color = "SystemButtonFace"
-        estoque_na_estante = process_data['quantidade_kg']
-        peso_no_balcao = process_data.get('peso_no_balcao', 0.0)
+        estoque_na_estante = process_data.quantidade_kg
+        peso_no_balcao = process_data.peso_no_balcao
 
         card_frame = tk.LabelFrame(cards_container, text=f"Processo {process_id}",
                                    font=("Arial", 10, "bold"), bd=2, relief="groove", padx=10, pady=5)
@@ -1063,7 +846,7 @@ def update_abastecedor_completed_processes_display(window_ref):
         card_frame.grid(row=row, column=col, padx=5, pady=5, sticky="nsew")
         cards_container.grid_columnconfigure(col, weight=1)
 
-        sku_info = SKU_DEFINITIONS.get(process_data['sku'], {})
+        sku_info = SKU_DEFINITIONS.get(process_data.sku, {})
         display_name = sku_info.get('display_column_label', 'SKU Desconhecido')
 
         tk.Label(card_frame, text=f"Produto: {display_name}", font=("Arial", 9, "bold")).pack(anchor="w")
@@ -1168,32 +951,15 @@ def open_movimentador_interface(parent_screen, username):
         update_movimentador_processes(window)
 
 
-def handle_movimentacao_button(process_original_index, window_ref, step_absolute_day):
-    global completed_day2_processes_by_filial
-
-    if 0 <= process_original_index < len(generated_processes):
-        process = generated_processes[process_original_index]
-
-        if process.get("filial") != window_ref.current_logged_in_filial:
+def handle_movimentacao_button(process_id, window_ref, step_absolute_day):
+    process = motor.processo(process_id)
+    if process:
+        if process.filial != window_ref.current_logged_in_filial:
             messagebox.showwarning("Ação Inválida", "Este processo não pertence à sua filial.")
             return
 
-        step_info = process["steps_status"].get(str(step_absolute_day))
-
-        if not step_info or step_info["status"] not in ["Aguardando"]:
-            messagebox.showwarning("Ação Inválida", f"A etapa do Dia {step_absolute_day} do processo {process['numero']} não está no estado 'Aguardando'.")
-            return
-
-        # --- DADOS PARA O LOG ---
-        user = window_ref.current_user
-        filial = process["filial"]
-        sku = process["sku"]
-        process_id = process["sku_process_number"]
-        quantidade = process["quantidade_kg"]
-        day_offset = step_absolute_day - process["dia_geracao"]
-        # --- FIM DOS DADOS PARA O LOG ---
-
-        if not step_info.get("movimentacao_started", False):
+        day_offset = process.day_offset(step_absolute_day)
+        if day_offset is not None and process.status_etapas[day_offset] == ETAPA_AGUARDANDO and process.movimentacao(day_offset) is None:
             messagebox.showinfo(
                 "Iniciar Movimentação",
                 "CUIDADOS IMPORTANTES:\n\n"
@@ -1202,59 +968,21 @@ def handle_movimentacao_button(process_original_index, window_ref, step_absolute
                 "- Evite contaminação cruzada. Use utensílios limpos para cada SKU.\n"
                 "- Mantenha a área de trabalho higienizada."
             )
-            step_info["movimentacao_started"] = True
-
-            step_info["inicio_movimentacao_ts"] = get_current_simulated_datetime()
-            step_info["responsavel_movimentacao"] = user
-
-            log_event(
-                evento="MOVIMENTAÇÃO INICIADA",
-                filial=filial,
-                sku=sku,
-                process_id=process_id,
-                dia_processo=day_offset,
-                quantidade_kg=quantidade,
-                usuario=user,
-                info_adicional=f"Início da movimentação para o dia {day_offset} do ciclo."
-            )
-
-            update_movimentador_processes(window_ref)
-        else:
-            step_info["status"] = "Feito"
-            step_info["data_movimentacao"] = f"Dia {current_day} - Hora {current_hour:02d}:00"
-            step_info["dia_conclusao"] = current_day
-
-            step_info["confirmacao_movimentacao_ts"] = get_current_simulated_datetime()
-
-            messagebox.showinfo("Movimentação Confirmada", f"Etapa do Dia {day_offset} do processo {process['numero']} marcada como FEITO.")
-
-            log_event(
-                evento="MOVIMENTAÇÃO CONFIRMADA",
-                filial=filial,
-                sku=sku,
-                process_id=process_id,
-                dia_processo=day_offset,
-                quantidade_kg=quantidade,
-                usuario=user,
-                info_adicional=f"Confirmação da movimentação para o dia {day_offset} do ciclo."
-            )
 
-            total_days_cycle = process.get("days_cycle", 3)
-            if day_offset == (total_days_cycle - 1):
-                filial_do_processo = process["filial"]
-                process_id_to_add = process["sku_process_number"]
-                if process_id_to_add not in completed_day2_processes_by_filial[filial_do_processo]:
-                    completed_day2_processes_by_filial[filial_do_processo].append(process_id_to_add)
-                    print(f"Processo {process_id_to_add} (Filial {filial_do_processo}) concluído no Dia {day_offset}. Adicionado para exibição do abastecedor.")
+        try:
+            resultado = motor.movimentar(process, step_absolute_day, window_ref.current_user)
+        except ValueError as e:
+            messagebox.showwarning("Ação Inválida", str(e))
+            return
 
+        if resultado == "confirmada":
+            messagebox.showinfo("Movimentação Confirmada", f"Etapa do Dia {day_offset} do processo {process.numero} marcada como FEITO.")
+            if day_offset == (process.days_cycle - 1):
                 for win in open_abastecedor_windows:
                     update_abastecedor_completed_processes_display(win)
-
                 update_controller_weight_panel()
 
-            update_process_states_on_time_change()
-
-            update_movimentador_processes(window_ref)
+        update_movimentador_processes(window_ref)
     else:
         messagebox.showerror("Erro", "Processo inválido.")
 
@@ -1265,33 +993,19 @@ def update_movimentador_processes(window_ref):
 
         filial_desta_janela = window_ref.current_logged_in_filial
 
-        filtered_processes = []
-        for p in generated_processes:
-            if p.get("filial") == filial_desta_janela:
-                total_days_cycle = p.get("days_cycle", 3)
-                last_day_offset = total_days_cycle - 1
-                absolute_last_day = p["dia_geracao"] + last_day_offset
-
-                last_step_info = p["steps_status"].get(str(absolute_last_day))
-
-                mostrar_processo = False
-                if not last_step_info or last_step_info.get("status") != "Feito":
-                    mostrar_processo = True
-                elif last_step_info.get("status") == "Feito":
-                    dia_de_conclusao = last_step_info.get("dia_conclusao")
-                    if dia_de_conclusao is not None and dia_de_conclusao == current_day:
-                        mostrar_processo = True
-
-                if mostrar_processo:
-                    filtered_processes.append(p)
+        # Processos em andamento e os concluídos hoje, direto dos índices do registro
+        filtered_processes = (
+            motor.processos.filtrar(filial=filial_desta_janela, status=STATUS_EM_ANDAMENTO)
+            + motor.processos.filtrar(filial=filial_desta_janela, dia_conclusao=motor.dia_atual)
+        )
 
         processes_by_sku = {}
         for sku_key in SKU_DEFINITIONS.keys():
             processes_by_sku[sku_key] = []
 
         for process in filtered_processes:
-            if process['sku'] in processes_by_sku:
-                processes_by_sku[process['sku']].append(process)
+            if process.sku in processes_by_sku:
+                processes_by_sku[process.sku].append(process)
 
         if not filtered_processes:
             tk.Label(window_ref.process_frame, text=f"Nenhum processo gerado para a Filial {filial_desta_janela} ainda.", font=("Arial", 12)).pack(pady=10)
@@ -1305,15 +1019,15 @@ def update_movimentador_processes(window_ref):
                 column_frame.pack(side="left", fill="y", expand=False, padx=5, pady=5)
 
                 processes_in_column = processes_by_sku[sku_key]
-                processes_in_column.sort(key=lambda p: p['sku_process_number'])
+                processes_in_column.sort(key=lambda p: p.sku_process_number)
 
                 for process in processes_in_column:
-                    main_process_frame = tk.LabelFrame(column_frame, text=f"Processo {process['sku_process_number']}",
+                    main_process_frame = tk.LabelFrame(column_frame, text=f"Processo {process.sku_process_number}",
                                                         font=("Arial", 10, "bold"), bd=2, relief="raised", padx=5, pady=3)
                     main_process_frame.pack(pady=5, padx=3, fill="x")
 
                     filial = window_ref.current_logged_in_filial
-                    sku = process['sku']
+                    sku = process.sku
                     quantidade = None
                     if filial in sku_default_quantities and sku in sku_default_quantities[filial]:
                         val = sku_default_quantities[filial][sku]
@@ -1322,33 +1036,34 @@ def update_movimentador_processes(window_ref):
                         else:
                             quantidade = val
                     else:
-                        quantidade = process.get('quantidade_kg', 0)
+                        quantidade = process.quantidade_kg
                     tk.Label(main_process_frame, text=f"SKU: {sku} - Qtde: {quantidade} kg", font=("Arial", 9)).pack(anchor="w")
                     daily_steps_container = tk.Frame(main_process_frame)
                     daily_steps_container.pack(pady=3, padx=3, fill="x")
 
-                    steps_descriptions = process.get('steps_descriptions', {})
-                    total_days_cycle = process.get('days_cycle', 3)
+                    steps_descriptions = process.steps_descriptions
+                    total_days_cycle = process.days_cycle
 
                     for day_offset in range(total_days_cycle):
-                        absolute_step_day = process["dia_geracao"] + day_offset
-                        step_info = process["steps_status"].get(str(absolute_step_day))
+                        absolute_step_day = process.dia_geracao + day_offset
+                        step_status = process.status_etapas[day_offset]
+                        movimentacao = process.movimentacao(day_offset)
 
-                        if step_info and (step_info["status"] != "Desabilitado" or (current_day == absolute_step_day and current_hour < 6)):
+                        if step_status != ETAPA_DESABILITADA or (motor.dia_atual == absolute_step_day and motor.hora_atual < 6):
                             bg_color = "lightgray"
 
                             step_frame = tk.LabelFrame(daily_steps_container, text=f"Dia {day_offset}",
                                                        font=("Arial", 8, "bold"), bd=1, relief="solid", padx=3, pady=2)
                             step_frame.pack(side="left", padx=2, pady=2, fill="both", expand=True)
 
-                            if step_info["status"] == "Aguardando":
+                            if step_status == ETAPA_AGUARDANDO:
                                 if day_offset == (total_days_cycle - 1):
                                     bg_color = "lightblue"
                                 else:
                                     bg_color = "lightcoral"
 
                                 if day_offset == 0:
-                                    description_text = f"Retire {process['quantidade_kg']} kg de {SKU_DEFINITIONS[process['sku']]['display_column_label']} do congelador e coloque na estante esquerda."
+                                    description_text = f"Retire {process.quantidade_kg} kg de {SKU_DEFINITIONS[process.sku]['display_column_label']} do congelador e coloque na estante esquerda."
                                 elif day_offset == 1:
                                     description_text = "Retire da estante esquerda e coloque na central."
                                 elif day_offset == 2:
@@ -1356,27 +1071,27 @@ def update_movimentador_processes(window_ref):
                                 else:
                                     description_text = steps_descriptions.get(day_offset, "Descrição não disponível.")
 
-                                tk.Label(step_frame, text=f"Estado: {step_info['status']}", font=("Arial", 8), bg=bg_color).pack(anchor="w")
+                                tk.Label(step_frame, text=f"Estado: {NOMES_STATUS_ETAPA[step_status]}", font=("Arial", 8), bg=bg_color).pack(anchor="w")
                                 tk.Label(step_frame, text=description_text, font=("Arial", 7, "italic"), wraplength=80, justify="left", bg=bg_color).pack(anchor="w", pady=(2,0))
 
-                                button_text = "Iniciar Movimentação" if not step_info.get("movimentacao_started", False) else "Confirmar Movimentação"
+                                button_text = "Iniciar Movimentação" if movimentacao is None else "Confirmar Movimentação"
 
                                 btn_movimentacao = tk.Button(step_frame, text=button_text,
-                                                             command=lambda idx=generated_processes.index(process), current_win=window_ref, s_day=absolute_step_day: handle_movimentacao_button(idx, current_win, s_day),
+                                                             command=lambda p_id=process.sku_process_number, current_win=window_ref, s_day=absolute_step_day: handle_movimentacao_button(p_id, current_win, s_day),
                                                              font=("Arial", 7), bg="lightblue", state="normal")
                                 btn_movimentacao.pack(pady=2)
 
-                            elif step_info["status"] == "Desabilitado":
+                            elif step_status == ETAPA_DESABILITADA:
                                 bg_color = "gray"
                                 tk.Label(step_frame, text="Iniciando rotinas às 06:00", font=("Arial", 8, "bold"), bg=bg_color, fg="white", wraplength=80, justify="center").pack(expand=True, fill="both")
 
-                            elif step_info["status"] == "Feito":
+                            elif step_status == ETAPA_FEITA:
                                 bg_color = "lightgreen"
                                 description = steps_descriptions.get(day_offset, "Descrição não disponível.")
 
-                                tk.Label(step_frame, text=f"Estado: {step_info['status']}", font=("Arial", 8), bg=bg_color).pack(anchor="w")
+                                tk.Label(step_frame, text=f"Estado: {NOMES_STATUS_ETAPA[step_status]}", font=("Arial", 8), bg=bg_color).pack(anchor="w")
                                 tk.Label(step_frame, text=description, font=("Arial", 7, "italic"), wraplength=80, justify="left", bg=bg_color).pack(anchor="w", pady=(2,0))
-                                tk.Label(step_frame, text=f"Concluído: {step_info['data_movimentacao']}", font=("Arial", 7), bg=bg_color).pack(anchor="w")
+                                tk.Label(step_frame, text=f"Concluído: {movimentacao.data_movimentacao}", font=("Arial", 7), bg=bg_color).pack(anchor="w")
 
                                 btn_movimentacao = tk.Button(step_frame, text="Movimentação Concluída",
                                                              font=("Arial", 7), bg="lightgreen", state="disabled")
@@ -1410,37 +1125,26 @@ def register_purchase():
         messagebox.showerror("Erro de Validação", "Por favor, insira um valor numérico válido para a quantidade.")
         return
 
-    process_found = False
-    for process in generated_processes:
-        if process["sku_process_number"] == selected_process_id:
-            current_weight = process.get("peso_no_balcao", 0.0)
-
-            if amount_removed > current_weight:
-                messagebox.showerror(
-                    "Estoque Insuficiente",
-                    f"Não é possível retirar {amount_removed:.2f} kg.\n"
-                    f"O balcão possui apenas {current_weight:.2f} kg deste processo."
-                )
-                return
-
-            process["peso_no_balcao"] -= amount_removed
-            process_found = True
-            break
-
-    if process_found:
-        messagebox.showinfo("Sucesso", f"Compra de {amount_removed:.2f} kg registrada para o processo {selected_process_id}.")
-        controller_window.purchase_entry.delete(0, tk.END)
-        for win in open_abastecedor_windows:
-            update_abastecedor_completed_processes_display(win)
-    else:
+    try:
+        motor.registrar_compra(selected_process_id, amount_removed)
+    except KeyError:
         messagebox.showerror("Erro", f"Não foi possível encontrar o processo {selected_process_id}.")
+        return
+    except ValueError as e:
+        messagebox.showerror("Estoque Insuficiente", str(e))
+        return
+
+    messagebox.showinfo("Sucesso", f"Compra de {amount_removed:.2f} kg registrada para o processo {selected_process_id}.")
+    controller_window.purchase_entry.delete(0, tk.END)
+    for win in open_abastecedor_windows:
+        update_abastecedor_completed_processes_display(win)
 
 def update_controller_weight_panel():
     if not (controller_window and controller_window.winfo_exists()):
         return
 
     processos_prontos = []
-    for lista_processos in list(completed_day2_processes_by_filial.values()):
+    for lista_processos in list(motor.concluidos_por_filial.values()):
         processos_prontos.extend(lista_processos)
 
     controller_window.process_selector['values'] = sorted(processos_prontos)
@@ -1468,10 +1172,10 @@ def open_controller_interface():
         time_frame = tk.LabelFrame(controller_window, text="Controle de Tempo", padx=10, pady=10)
         time_frame.pack(pady=10, fill="x", padx=20)
 
-        controller_window.day_label = tk.Label(time_frame, text=f"Dia Atual: {current_day}", font=("Arial", 12))
+        controller_window.day_label = tk.Label(time_frame, text=f"Dia Atual: {motor.dia_atual}", font=("Arial", 12))
         controller_window.day_label.pack(pady=5)
 
-        controller_window.hour_label = tk.Label(time_frame, text=f"Hora Atual: {current_hour:02d}:00", font=("Arial", 12))
+        controller_window.hour_label = tk.Label(time_frame, text=f"Hora Atual: {motor.hora_atual:02d}:00", font=("Arial", 12))
         controller_window.hour_label.pack(pady=5)
 
         tk.Label(time_frame, text="Avançar Horas:", font=("Arial", 12)).pack(pady=(10,0))
@@ -1487,6 +1191,8 @@ def open_controller_interface():
 
         btn_retrain_model = tk.Button(controller_window, text="Re-treinar Modelo de Demanda", command=retrain_model, font=("Arial", 12), bg="#FF9800", fg="white")
         btn_retrain_model.pack(pady=5)
+        controller_window.retrain_status_label = tk.Label(controller_window, text="", font=("Arial", 10, "italic"))
+        controller_window.retrain_status_label.pack()
 
         purchase_sim_frame = tk.LabelFrame(controller_window, text="Simulador de Compra", padx=10, pady=10)
         purchase_sim_frame.pack(pady=10, fill="x", padx=20)
@@ -1512,12 +1218,49 @@ def open_controller_interface():
         controller_window.lift()
         update_controller_weight_panel()
 
+def atualizar_status_retreinamento(texto):
+    if controller_window and controller_window.winfo_exists():
+        controller_window.retrain_status_label.config(text=texto)
+
 def retrain_model():
+    """
+    Inicia o re-treino em outro processo; a interface continua respondendo enquanto isso.
+    Se houver modelos particionados (registro_particoes.json), eles são re-treinados junto.
+    """
+    global retreinamento_em_andamento
+    if retreinamento_em_andamento is not None:
+        messagebox.showinfo("Modelo", "Já existe um re-treinamento em andamento.")
+        return
+    from main import TreinamentoEmSegundoPlano
     vendas_path = os.path.join(script_dir, "dados_vendas.csv")
-    previsor.carregar_dados_vendas(vendas_path)
-    previsor.preparar_features()
-    previsor.treinar_modelo()
-    messagebox.showinfo("Modelo", "Modelo re-treinado com sucesso!")
+    hiperparametros = previsor.hiperparametros if previsor is not None else None
+    retreinamento_em_andamento = TreinamentoEmSegundoPlano(script_dir, vendas_path, hiperparametros)
+    atualizar_status_retreinamento("Re-treinamento iniciado...")
+    login_screen_ref.after(200, acompanhar_retreinamento)
+
+def acompanhar_retreinamento():
+    """Mostra o progresso do re-treino e troca o previsor quando o novo modelo estiver pronto."""
+    global retreinamento_em_andamento, previsor
+    for mensagem in retreinamento_em_andamento.progresso():
+        atualizar_status_retreinamento(mensagem)
+
+    if not retreinamento_em_andamento.concluido():
+        login_screen_ref.after(200, acompanhar_retreinamento)
+        return
+
+    try:
+        novo_previsor = retreinamento_em_andamento.resultado()
+    except Exception as e:
+        atualizar_status_retreinamento("Falha no re-treinamento.")
+        messagebox.showerror("Modelo", f"Erro ao re-treinar o modelo:\n{e}")
+    else:
+        # Troca atômica: as próximas previsões já usam o novo modelo
+        with trava_previsor:
+            previsor = novo_previsor
+        atualizar_status_retreinamento("Modelo re-treinado e em uso.")
+        messagebox.showinfo("Modelo", "Modelo re-treinado com sucesso!")
+    finally:
+        retreinamento_em_andamento = None
 
 def open_sku_quantity_config_interface():
     global sku_quantity_config_window
@@ -1606,37 +1349,55 @@ def on_controller_close(window, window_ref_var_name):
         window.lift()
 
 
-# --- Configuração Inicial do Aplicativo ---
-login_screen_ref = tk.Tk()
-login_screen_ref.title("Sistema de Gerenciamento")
-login_screen_ref.geometry("400x300")
-
-label_title = tk.Label(login_screen_ref, text="Bem-vindo(a)!", font=("Arial", 16, "bold"))
-label_title.pack(pady=20)
-
-login_frame = tk.Frame(login_screen_ref)
-login_frame.pack(pady=10)
-
-label_username = tk.Label(login_frame, text="Usuário:", font=("Arial", 12))
-label_username.grid(row=0, column=0, padx=5, pady=5, sticky="e")
-entry_username = tk.Entry(login_frame, font=("Arial", 12))
-entry_username.grid(row=0, column=1, padx=5, pady=5)
-entry_username.focus_set()
+motor = MotorSimulacao(
+    SKU_DEFINITIONS, KNOWN_FILIAIS,
+    quantidades=quantidades_para_descongelamento,
+    registrar_evento=log_event,
+    ao_mensagem=print,
+    ao_registrar_sobra=registrar_sobra,
+    ao_encerrar_processo=gerar_relatorio_abastecimento,
+    ao_fim_de_expediente=concluir_fim_de_expediente,
+    arquivo=ArquivoProcessos(PROCESS_ARCHIVE_FILE),
+)
 
-label_password = tk.Label(login_frame, text="Senha:", font=("Arial", 12))
-label_password.grid(row=1, column=0, padx=5, pady=5, sticky="e")
-entry_password = tk.Entry(login_frame, show="*", font=("Arial", 12))
-entry_password.grid(row=1, column=1, padx=5, pady=5)
-
-btn_login = tk.Button(login_screen_ref, text="Entrar", command=login, font=("Arial", 12), bg="#007BFF", fg="white")
-btn_login.pack(pady=10)
-
-inicializar_previsor()
-# --- Initial Process Generation and State Update ---
-perform_daily_process_generation()
-update_process_states_on_time_change()
-# --- End of Initial Process Generation and State Update ---
-
-open_controller_interface()
-
-login_screen_ref.mainloop()
\ No newline at end of file
+# --- Configuração Inicial do Aplicativo ---
+# Só ao executar o app: importar o módulo não cria janelas (o MotorSimulacao roda sem display)
+if __name__ == "__main__":
+    users = load_users()
+    sku_default_quantities = load_sku_quantities()
+
+    login_screen_ref = tk.Tk()
+    login_screen_ref.title("Sistema de Gerenciamento")
+    login_screen_ref.geometry("400x300")
+
+    label_title = tk.Label(login_screen_ref, text="Bem-vindo(a)!", font=("Arial", 16, "bold"))
+    label_title.pack(pady=20)
+
+    login_frame = tk.Frame(login_screen_ref)
+    login_frame.pack(pady=10)
+
+    label_username = tk.Label(login_frame, text="Usuário:", font=("Arial", 12))
+    label_username.grid(row=0, column=0, padx=5, pady=5, sticky="e")
+    entry_username = tk.Entry(login_frame, font=("Arial", 12))
+    entry_username.grid(row=0, column=1, padx=5, pady=5)
+    entry_username.focus_set()
+
+    label_password = tk.Label(login_frame, text="Senha:", font=("Arial", 12))
+    label_password.grid(row=1, column=0, padx=5, pady=5, sticky="e")
+    entry_password = tk.Entry(login_frame, show="*", font=("Arial", 12))
+    entry_password.grid(row=1, column=1, padx=5, pady=5)
+
+    btn_login = tk.Button(login_screen_ref, text="Entrar", command=login, font=("Arial", 12), bg="#007BFF", fg="white")
+    btn_login.pack(pady=10)
+
+    # O modelo é carregado depois que a tela de login aparece; até lá a geração de processos
+    # usa as previsões já salvas em sku_quantities.json (mesmo de outro dia), recalculadas
+    # quando o modelo fica pronto
+    login_screen_ref.after(0, carregar_previsor_em_segundo_plano)
+    # --- Initial Process Generation and State Update ---
+    motor.iniciar()
+    # --- End of Initial Process Generation and State Update ---
+
+    open_controller_interface()
+
+    login_screen_ref.mainloop()
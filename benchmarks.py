@@ -0,0 +1,280 @@
+"""
+Benchmarks de desempenho do previsor de demanda e do motor da simulação.
+
+Uso:
+    python benchmarks.py inferencia [--repeticoes N]
+    python benchmarks.py importacao [--repeticoes N]
+    python benchmarks.py quantis [--filiais N]
+    python benchmarks.py memoria [--processos N]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def _cronometrar(funcao, repeticoes):
+    """Retorna a mediana, em milissegundos, do tempo de `repeticoes` chamadas de `funcao`."""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return float(np.median(tempos))
+
+
+def benchmark_inferencia(script_dir, caminho_dados, repeticoes):
+    """Compara a latência do predict do sklearn com a da FlorestaNumpy, para 1 linha e em lote."""
+    from main import PrevisorDemanda
+
+    previsor = PrevisorDemanda(script_dir)
+    previsor.carregar_dados_vendas(caminho_dados)
+    previsor.preparar_features()
+    previsor.carregar_ou_treinar_modelo()
+    modelo, floresta = previsor.modelo, previsor.floresta
+    modelo.set_params(n_jobs=1)
+
+    data_hoje = previsor.dados_vendas['data_dia'].max()
+    skus = sorted({sku for _, sku in previsor._indice_historico()})
+    print(f"Floresta: {floresta.n_arvores} árvores, {len(floresta.valor)} nós, profundidade {floresta.profundidade}")
+    print(f"{'linhas':>8} {'sklearn (ms)':>14} {'numpy (ms)':>12} {'ganho':>7} {'dif. máx.':>10}")
+    for n_linhas in (1, 8, 100, 1000):
+        datas = np.full(n_linhas, np.datetime64(data_hoje, 'ns'))
+        skus_lote = np.resize(np.array(skus), n_linhas)
+        X, _ = previsor._matriz_features(datas, skus_lote, np.full(n_linhas, '*', dtype=object))
+        X_df = pd.DataFrame(X, columns=previsor.colunas_features())
+
+        tempo_sklearn = _cronometrar(lambda: modelo.predict(X_df), repeticoes)
+        tempo_numpy = _cronometrar(lambda: floresta.prever(X), repeticoes)
+        diferenca = np.abs(modelo.predict(X_df) - floresta.prever(X)).max()
+        print(f"{n_linhas:>8} {tempo_sklearn:>14.3f} {tempo_numpy:>12.3f} "
+              f"{tempo_sklearn / tempo_numpy:>6.1f}x {diferenca:>10.2e}")
+
+
+MODULOS_PESADOS = ('numpy', 'pandas', 'sklearn', 'joblib', 'main')
+
+
+# Executado num interpretador novo: mede o tempo até a tela de login entrar no mainloop
+# (que é substituído para encerrar na hora) e quais módulos pesados já estavam importados.
+SCRIPT_INICIALIZACAO_APP = """
+import json, sys, time, tkinter
+inicio = time.perf_counter()
+def medir(self, *args, **kwargs):
+    print(json.dumps({
+        'segundos': time.perf_counter() - inicio,
+        'modulos': [m for m in %r if m in sys.modules],
+    }))
+    sys.stdout.flush()
+    self.destroy()
+    raise SystemExit(0)
+tkinter.Tk.mainloop = medir
+sys.path.insert(0, %r)
+import runpy
+runpy.run_module('Frango_app', run_name='__main__')
+"""
+
+
+SCRIPT_IMPORTACAO_MAIN = """
+import json, sys, time
+inicio = time.perf_counter()
+sys.path.insert(0, %r)
+import main
+print(json.dumps({
+    'segundos': time.perf_counter() - inicio,
+    'modulos': [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def _medir_em_processo_novo(script, repeticoes, cwd):
+    medicoes = []
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=cwd)
+        if saida.returncode != 0:
+            return None, saida.stderr.strip().splitlines()[-1] if saida.stderr.strip() else "erro"
+        medicoes.append(json.loads(saida.stdout.strip().splitlines()[-1]))
+    return medicoes, None
+
+
+def benchmark_quantis(script_dir, caminho_dados, n_filiais):
+    """Compara a previsão pontual em lote com as faixas P10/P50/P90 para todos os SKUs x `n_filiais` filiais."""
+    from main import PrevisorDemanda
+
+    previsor = PrevisorDemanda(script_dir)
+    previsor.carregar_dados_vendas(caminho_dados)
+    previsor.preparar_features()
+    previsor.carregar_ou_treinar_modelo()
+    previsor.modelo  # desserializa o modelo do sklearn fora da medição
+
+    data_hoje = previsor.dados_vendas['data_dia'].max().to_pydatetime()
+    skus = sorted({sku for _, sku in previsor._indice_historico()})
+    chaves = [(data_hoje, sku, str(filial)) for filial in range(n_filiais) for sku in skus]
+    for descricao, funcao in (
+        ("pontual", lambda: previsor.prever_demanda_lote(chaves)),
+        ("P10/P50/P90", lambda: previsor.prever_quantis_lote(chaves)),
+    ):
+        # Cache de previsões limpo a cada repetição, para medir o cálculo
+        tempo = _cronometrar(lambda: (previsor.cache_previsoes.limpar(), funcao()), 5)
+        print(f"{descricao:>12}: {len(chaves)} pares em {tempo:.1f} ms")
+
+
+def _tamanho_profundo(objeto, vistos):
+    """Bytes de `objeto` e de tudo o que ele referencia, sem contar de novo o que está em `vistos`."""
+    tamanho = 0
+    pendentes = [objeto]
+    while pendentes:
+        atual = pendentes.pop()
+        if id(atual) in vistos:
+            continue
+        vistos.add(id(atual))
+        tamanho += sys.getsizeof(atual)
+        if isinstance(atual, dict):
+            pendentes.extend(atual.keys())
+            pendentes.extend(atual.values())
+        elif isinstance(atual, (list, tuple)):
+            pendentes.extend(atual)
+        elif hasattr(type(atual), '__slots__'):
+            pendentes.extend(getattr(atual, campo, None) for campo in type(atual).__slots__)
+    return tamanho
+
+
+def _processo_em_dicionario(processo):
+    """O mesmo processo no layout anterior ao Processo compacto: dicionários aninhados, etapas por dia absoluto em texto."""
+    from motor_simulacao import NOMES_STATUS_ETAPA, NOMES_STATUS_PROCESSO
+
+    steps_status = {}
+    for day_offset, codigo in enumerate(processo.status_etapas):
+        etapa = {"status": NOMES_STATUS_ETAPA[codigo], "movimentacao_started": False, "data_movimentacao": None}
+        movimentacao = processo.movimentacao(day_offset)
+        if movimentacao is not None:
+            etapa.update({
+                "movimentacao_started": True,
+                "inicio_movimentacao_ts": movimentacao.inicio_ts,
+                "responsavel_movimentacao": movimentacao.responsavel,
+            })
+            if movimentacao.confirmacao_ts is not None:
+                etapa.update({
+                    "data_movimentacao": movimentacao.data_movimentacao,
+                    "dia_conclusao": movimentacao.dia_conclusao,
+                    "confirmacao_movimentacao_ts": movimentacao.confirmacao_ts,
+                })
+        steps_status[str(processo.dia_geracao + day_offset)] = etapa
+    return {
+        "numero": processo.numero,
+        "sku_process_number": processo.sku_process_number,
+        "dia_geracao": processo.dia_geracao,
+        "hora_criacao": processo.hora_criacao,
+        "sku": processo.sku,
+        "quantidade_inicial_kg": processo.quantidade_inicial_kg,
+        "quantidade_kg": processo.quantidade_kg,
+        "peso_no_balcao": processo.peso_no_balcao,
+        "filial": processo.filial,
+        "days_cycle": processo.days_cycle,
+        "steps_descriptions": processo.steps_descriptions,
+        "steps_status": steps_status,
+        "replenishment_log": list(processo.replenishment_log or []),
+        "status": NOMES_STATUS_PROCESSO[processo.status],
+        "dia_conclusao": processo.dia_conclusao,
+    }
+
+
+def benchmark_memoria(n_processos):
+    """
+    Bytes por processo com `n_processos` processos vivos (etapa do dia 0 já confirmada):
+    Processo compacto x layout anterior em dicionários, e o motor inteiro (com os índices
+    do registro e a agenda), medido pelo tracemalloc.
+    """
+    import tracemalloc
+    from motor_simulacao import MotorSimulacao, SKU_DEFINITIONS
+
+    filiais = [str(filial) for filial in range(-(-n_processos // len(SKU_DEFINITIONS)))]
+    tracemalloc.start()
+    inicio = tracemalloc.get_traced_memory()[0]
+    motor = MotorSimulacao(filiais=filiais)
+    motor.iniciar()
+    motor.executar_ate(0, 7, a_cada_hora=lambda m: m.concluir_etapas_aguardando("benchmark"))
+    bytes_motor = tracemalloc.get_traced_memory()[0] - inicio
+    tracemalloc.stop()
+
+    processos = list(motor.processos)
+    # As definições dos SKUs são compartilhadas nos dois layouts e ficam fora da conta
+    compartilhados = set()
+    _tamanho_profundo(SKU_DEFINITIONS, compartilhados)
+    vistos = set(compartilhados)
+    bytes_compacto = sum(_tamanho_profundo(processo, vistos) for processo in processos)
+    # Os dicionários ficam vivos durante a medição, para que seus ids não sejam reaproveitados
+    dicionarios = [_processo_em_dicionario(processo) for processo in processos]
+    vistos = set(compartilhados)
+    bytes_dicionario = sum(_tamanho_profundo(dicionario, vistos) for dicionario in dicionarios)
+
+    n = len(processos)
+    print(f"{n} processos vivos ({len(filiais)} filiais x {len(SKU_DEFINITIONS)} SKUs), etapa do dia 0 confirmada")
+    print(f"{'Processo (__slots__)':>30}: {bytes_compacto / n:8.0f} bytes/processo")
+    print(f"{'dicionários (layout anterior)':>30}: {bytes_dicionario / n:8.0f} bytes/processo")
+    print(f"{'motor completo (tracemalloc)':>30}: {bytes_motor / n:8.0f} bytes/processo")
+
+
+def _copiar_scripts(script_dir, destino):
+    """Copia os módulos (com o __pycache__, para não medir a compilação), a tabela de previsões e os usuários."""
+    for nome in os.listdir(script_dir):
+        origem = os.path.join(script_dir, nome)
+        if nome == '__pycache__':
+            shutil.copytree(origem, os.path.join(destino, nome))
+        elif nome.endswith('.py') or nome in ('sku_quantities.json', 'users.json'):
+            shutil.copy2(origem, destino)
+
+
+def benchmark_importacao(script_dir, repeticoes):
+    """
+    Mede, em interpretadores novos, o custo de importar `main` e o tempo até a tela de login.
+
+    Roda numa cópia temporária dos scripts: ao abrir, o Frango_app limpa o arquivo de
+    processos e registra os processos do dia no log de movimentações.
+    """
+    with tempfile.TemporaryDirectory() as copia:
+        _copiar_scripts(script_dir, copia)
+        for descricao, script in (
+            ("import main", SCRIPT_IMPORTACAO_MAIN % (copia, MODULOS_PESADOS)),
+            ("Frango_app até a tela de login", SCRIPT_INICIALIZACAO_APP % (MODULOS_PESADOS, copia)),
+        ):
+            medicoes, erro = _medir_em_processo_novo(script, repeticoes, copia)
+            if medicoes is None:
+                print(f"{descricao}: não foi possível medir ({erro})")
+                continue
+            mediana = float(np.median([m['segundos'] for m in medicoes]))
+            print(f"{descricao}: {mediana * 1000:.0f} ms (mediana de {repeticoes}); "
+                  f"módulos carregados: {', '.join(medicoes[-1]['modulos']) or 'nenhum'}")
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description="Benchmarks do previsor de demanda.")
+    parser.add_argument('--dados', default=os.path.join(script_dir, 'dados_vendas.csv'), help="CSV de vendas diárias")
+    parser.add_argument('--script-dir', default=script_dir, help="Diretório do modelo e dos caches")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    inferencia = subcomandos.add_parser('inferencia', help="Latência do predict: sklearn x FlorestaNumpy.")
+    inferencia.add_argument('--repeticoes', type=int, default=50)
+    importacao = subcomandos.add_parser('importacao', help="Tempo de importação e de abertura da tela de login.")
+    importacao.add_argument('--repeticoes', type=int, default=5)
+    quantis = subcomandos.add_parser('quantis', help="Custo das faixas de previsão em lote.")
+    quantis.add_argument('--filiais', type=int, default=500)
+    memoria = subcomandos.add_parser('memoria', help="Memória por processo vivo no motor da simulação.")
+    memoria.add_argument('--processos', type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.comando == 'inferencia':
+        benchmark_inferencia(args.script_dir, args.dados, args.repeticoes)
+    elif args.comando == 'quantis':
+        benchmark_quantis(args.script_dir, args.dados, args.filiais)
+    elif args.comando == 'memoria':
+        benchmark_memoria(args.processos)
+    elif args.comando == 'importacao':
+        benchmark_importacao(os.path.dirname(os.path.abspath(__file__)), args.repeticoes)
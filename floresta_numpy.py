@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class FlorestaNumpy:
+    """
+    Floresta de regressão (RandomForestRegressor) exportada para arrays NumPy planos.
+
+    Todos os nós de todas as árvores ficam concatenados em arrays planos (feature, limiar,
+    filhos e valor), e `raizes` aponta o primeiro nó de cada árvore. `filhos[2 * no]` é o
+    filho direito e `filhos[2 * no + 1]` o esquerdo; as folhas apontam para si mesmas, de
+    modo que a previsão desce todas as árvores para todas as linhas ao mesmo tempo, em
+    `profundidade` passos vetorizados, sem a validação de entrada e o despacho de threads
+    do sklearn a cada chamada.
+    """
+    CAMPOS = ('feature', 'limiar', 'filhos', 'valor', 'raizes')
+
+    def __init__(self, feature, limiar, filhos, valor, raizes, profundidade):
+        # Os arrays são usados como recebidos (inclusive memmaps somente leitura)
+        self.feature = feature
+        self.limiar = limiar
+        self.filhos = filhos
+        self.valor = valor
+        self.raizes = raizes
+        self.profundidade = int(profundidade)
+
+    @classmethod
+    def de_sklearn(cls, modelo):
+        features, limiares, filhos, valores, raizes = [], [], [], [], []
+        profundidade = 0
+        inicio = 0
+        for estimador in modelo.estimators_:
+            arvore = estimador.tree_
+            n_nos = arvore.node_count
+            folha = arvore.children_left == -1
+            indices = np.arange(inicio, inicio + n_nos, dtype=np.int32)
+
+            features.append(np.where(folha, 0, arvore.feature).astype(np.int32))
+            limiares.append(np.where(folha, 0.0, arvore.threshold).astype(np.float64))
+            esquerda = np.where(folha, indices, arvore.children_left + inicio)
+            direita = np.where(folha, indices, arvore.children_right + inicio)
+            filhos.append(np.column_stack((direita, esquerda)).ravel().astype(np.int32))
+            valores.append(arvore.value[:, 0, 0].astype(np.float64))
+            raizes.append(inicio)
+            profundidade = max(profundidade, arvore.max_depth)
+            inicio += n_nos
+
+        return cls(
+            np.concatenate(features), np.concatenate(limiares), np.concatenate(filhos),
+            np.concatenate(valores), np.array(raizes, dtype=np.int32), profundidade,
+        )
+
+    def arrays(self):
+        """Dicionário com os arrays da floresta (e a profundidade), para serialização."""
+        return {**{campo: getattr(self, campo) for campo in self.CAMPOS}, 'profundidade': self.profundidade}
+
+    @classmethod
+    def de_arrays(cls, arrays):
+        return cls(*(arrays[campo] for campo in cls.CAMPOS), arrays['profundidade'])
+
+    @property
+    def n_arvores(self):
+        return len(self.raizes)
+
+    def prever_por_arvore(self, X):
+        """Retorna a previsão de cada árvore: matriz (n_arvores, n_linhas)."""
+        # O sklearn compara as features em float32 com limiares em float64; repetimos
+        # a mesma conversão para obter exatamente os mesmos caminhos nas árvores.
+        X = np.asarray(X, dtype=np.float32)
+        n_linhas, n_colunas = X.shape
+        X_plano = X.ravel()
+        inicio_linha = np.arange(n_linhas, dtype=np.int64) * n_colunas
+        nos = np.repeat(self.raizes, n_linhas)
+        inicio_linha = np.tile(inicio_linha, self.n_arvores)
+        for _ in range(self.profundidade):
+            vai_esquerda = X_plano[inicio_linha + self.feature[nos]] <= self.limiar[nos]
+            nos = self.filhos[2 * nos + vai_esquerda]
+        return self.valor[nos].reshape(self.n_arvores, n_linhas)
+
+    def prever(self, X):
+        return self.prever_por_arvore(X).mean(axis=0)
@@ -1,11 +1,21 @@
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from sklearn.ensemble import RandomForestRegressor
-import joblib
+import hashlib
+import itertools
+import json
 import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
-from sklearn.metrics import mean_absolute_error, mean_squared_error
+# sklearn e joblib são importados dentro das funções de treino e de leitura do modelo do
+# sklearn: previsões servidas pela FlorestaNumpy não pagam o custo de importá-los.
+from floresta_numpy import FlorestaNumpy
 
 # Eventos sazonais
 EVENTOS_SAZONAIS = {
@@ -24,119 +34,1454 @@ EVENTOS_SAZONAIS = {
     'Proclamacao Republica': {'datas': [datetime(y, 11, 15) for y in range(2023, 2026)], 'antecedencia_dias': 3},
 }
 
+# Chave de filial usada para o histórico que não identifica a filial (compartilhado por todas)
+FILIAL_GLOBAL = '*'
+
+# Hiperparâmetros do RandomForestRegressor (fazem parte da chave do cache do modelo)
+HIPERPARAMETROS = {'n_estimators': 150, 'max_depth': 8, 'random_state': 42}
+
+# Candidatos avaliados por `python main.py --buscar-hiperparametros`; o escolhido é salvo
+# em hiperparametros.json e passa a substituir HIPERPARAMETROS
+GRADE_HIPERPARAMETROS = {'n_estimators': (50, 100, 150, 300), 'max_depth': (6, 8, 12, None)}
+
+# Antecedência (em dias) da previsão usada para dimensionar o descongelamento
+HORIZONTE_PREVISAO_DIAS = 2
+
+# Percentis padrão das faixas de previsão (P10/P50/P90), ver prever_quantis_lote
+QUANTIS_PREVISAO = (10, 50, 90)
+
+# Período de histórico (em dias, contado a partir da última venda de cada filial/SKU)
+# usado no treino. None usa todo o histórico disponível.
+JANELA_TREINO_DIAS = 180
+
+# Janelas (em registros diários) das médias móveis usadas como features
+JANELAS_MEDIA_MOVEL = (7, 14)
+
+def nome_coluna_evento(evento):
+    return f'eh_{evento.lower().replace(" ", "_")}_prox'
+
+def nome_coluna_media(janela):
+    return f'media_{janela}d'
+
+def medias_moveis(df, janelas=JANELAS_MEDIA_MOVEL, chaves=('filial', 'sku'), coluna='total_venda_dia_kg'):
+    """
+    Calcula as médias móveis de `coluna` para todas as séries (filial, sku) em uma única passada.
+
+    Equivale a `rolling(janela, min_periods=1).mean()` aplicado em cada série, na ordem das
+    linhas de `df` (que deve estar ordenado por data), mas usando somas acumuladas por grupo
+    em vez de uma máscara por SKU, o que mantém o custo linear no número de linhas.
+
+    Returns:
+        pd.DataFrame: Uma coluna `media_{janela}d` por janela, com o mesmo índice de `df`.
+    """
+    chaves = [c for c in chaves if c in df.columns]
+    valores = df[coluna]
+    contagem = valores.notna().astype(float)
+    grupos = [df[c] for c in chaves]
+    soma_acumulada = valores.fillna(0.0).groupby(grupos, sort=False, observed=True).cumsum()
+    contagem_acumulada = contagem.groupby(grupos, sort=False, observed=True).cumsum()
+
+    medias = pd.DataFrame(index=df.index)
+    for janela in janelas:
+        soma_anterior = soma_acumulada.groupby(grupos, sort=False, observed=True).shift(janela, fill_value=0.0)
+        contagem_anterior = contagem_acumulada.groupby(grupos, sort=False, observed=True).shift(janela, fill_value=0.0)
+        n = contagem_acumulada - contagem_anterior
+        medias[nome_coluna_media(janela)] = ((soma_acumulada - soma_anterior) / n.where(n > 0)).fillna(0.0)
+    return medias
+
+# Leitura do CSV de vendas: tamanho dos blocos lidos por vez e versão do cache colunar
+TAMANHO_CHUNK_VENDAS = 100_000
+VERSAO_CACHE_VENDAS = 2
+
+def hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def ler_vendas_csv(caminho, tamanho_chunk=TAMANHO_CHUNK_VENDAS):
+    """
+    Lê o CSV de vendas em blocos, com tipos explícitos: data em formato fixo (dd/mm/aaaa),
+    kg em float32 e as colunas de texto (SKU, descrição, equipe, filial) como categóricas.
+    As colunas já saem normalizadas (minúsculas, `id_produto` renomeado para `sku`).
+    """
+    cabecalho = pd.read_csv(caminho, sep=';', encoding='latin1', nrows=0).columns
+    nomes = {col: col.strip().lower() for col in cabecalho}
+    nomes = {col: ('sku' if nome == 'id_produto' else nome) for col, nome in nomes.items()}
+    tipos = {
+        col: ('float32' if nome == 'total_venda_dia_kg' else str if nome == 'data_dia' else 'category')
+        for col, nome in nomes.items()
+    }
+
+    blocos = []
+    for bloco in pd.read_csv(caminho, sep=';', encoding='latin1', dtype=tipos, chunksize=tamanho_chunk):
+        bloco = bloco.rename(columns=nomes)
+        bloco['data_dia'] = pd.to_datetime(bloco['data_dia'], format='%d/%m/%Y', errors='coerce')
+        blocos.append(bloco)
+    if not blocos:
+        return pd.DataFrame({nome: pd.Series(dtype=tipos[col]) for col, nome in nomes.items()})
+
+    dados = {}
+    for col in blocos[0].columns:
+        partes = [bloco[col] for bloco in blocos]
+        if isinstance(partes[0].dtype, pd.CategoricalDtype):
+            dados[col] = pd.Series(pd.api.types.union_categoricals(partes))
+        else:
+            dados[col] = pd.concat(partes, ignore_index=True)
+    return pd.DataFrame(dados)
+
+def substituir_diretorio(temporario, diretorio):
+    """
+    Troca `diretorio` pelo `temporario` já gravado. O atual é primeiro renomeado: se não puder
+    ser (ex.: no Windows, com arquivos dele mapeados por outro processo), nada muda, o
+    temporário é apagado e o OSError é propagado.
+    """
+    antigo = f"{diretorio}.antigo-{os.getpid()}"
+    shutil.rmtree(antigo, ignore_errors=True)
+    try:
+        if os.path.exists(diretorio):
+            os.replace(diretorio, antigo)
+        os.replace(temporario, diretorio)
+    except OSError:
+        if os.path.exists(antigo) and not os.path.exists(diretorio):
+            os.replace(antigo, diretorio)
+        shutil.rmtree(temporario, ignore_errors=True)
+        raise
+    shutil.rmtree(antigo, ignore_errors=True)
+
+def salvar_cache_colunar(df, diretorio, hash_csv):
+    """
+    Grava `df` como um .npy por coluna (categóricas como códigos + categorias no meta.json),
+    para que a próxima carga abra os arrays com memory mapping em vez de re-interpretar o CSV.
+    `df` deve estar na ordem em que será usado (por data): a carga não reordena.
+    """
+    temporario = f"{diretorio}.tmp-{os.getpid()}"
+    os.makedirs(temporario, exist_ok=True)
+    colunas = []
+    for i, col in enumerate(df.columns):
+        serie = df[col]
+        info = {'nome': col, 'arquivo': f'col{i}.npy'}
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            info['categorias'] = [str(c) for c in serie.cat.categories]
+            valores = serie.cat.codes.to_numpy()
+        elif pd.api.types.is_datetime64_any_dtype(serie):
+            info['tipo'] = 'datetime64[ns]'
+            valores = serie.to_numpy(dtype='datetime64[ns]')
+        else:
+            valores = serie.to_numpy()
+        np.save(os.path.join(temporario, info['arquivo']), valores)
+        colunas.append(info)
+    with open(os.path.join(temporario, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'versao': VERSAO_CACHE_VENDAS, 'hash_csv': hash_csv, 'colunas': colunas}, f, ensure_ascii=False)
+    try:
+        substituir_diretorio(temporario, diretorio)
+    except OSError as e:
+        # O cache é opcional: se outro processo estiver gravando ou com ele mapeado, desiste
+        print(f"Não foi possível gravar o cache de vendas: {e}")
+
+def carregar_cache_colunar(diretorio, hash_csv):
+    """Abre o cache colunar com memory mapping se ele corresponder ao CSV; senão retorna None."""
+    caminho_meta = os.path.join(diretorio, 'meta.json')
+    if not os.path.exists(caminho_meta):
+        return None
+    try:
+        with open(caminho_meta, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('versao') != VERSAO_CACHE_VENDAS or meta.get('hash_csv') != hash_csv:
+            return None
+        dados = {}
+        for info in meta['colunas']:
+            valores = np.load(os.path.join(diretorio, info['arquivo']), mmap_mode='r')
+            if 'categorias' in info:
+                dados[info['nome']] = pd.Categorical.from_codes(valores, categories=info['categorias'])
+            else:
+                dados[info['nome']] = valores
+        return pd.DataFrame(dados, copy=False)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Cache de vendas ignorado: {e}")
+        return None
+
+class IndiceEventos:
+    """
+    Índice das janelas [data_evento - antecedencia_dias, data_evento] de cada evento sazonal.
+
+    As janelas de cada evento ficam mescladas e ordenadas em arrays de início/fim, de modo
+    que a consulta de qualquer quantidade de datas é feita com um único searchsorted por evento.
+    """
+    def __init__(self, eventos):
+        self.colunas = [nome_coluna_evento(evento) for evento in eventos] + ['eh_pagamento_prox']
+        self.janelas = []
+        for info in eventos.values():
+            antecedencia = timedelta(days=info['antecedencia_dias'])
+            inicios, fins = [], []
+            for data_evento in sorted(info['datas']):
+                inicio = data_evento - antecedencia
+                if fins and inicio <= fins[-1]:
+                    fins[-1] = max(fins[-1], data_evento)
+                else:
+                    inicios.append(inicio)
+                    fins.append(data_evento)
+            self.janelas.append((
+                np.array(inicios, dtype='datetime64[ns]'),
+                np.array(fins, dtype='datetime64[ns]'),
+            ))
+
+    def calcular(self, datas):
+        """Retorna uma matriz (len(datas), len(self.colunas)) de flags 0/1, na ordem de self.colunas."""
+        datas = pd.DatetimeIndex(datas)
+        valores = datas.values.astype('datetime64[ns]')
+        flags = np.zeros((len(valores), len(self.colunas)), dtype=np.int8)
+        for j, (inicios, fins) in enumerate(self.janelas):
+            idx = np.searchsorted(inicios, valores, side='right') - 1
+            dentro = idx >= 0
+            dentro[dentro] = valores[dentro] <= fins[idx[dentro]]
+            flags[:, j] = dentro
+        dias = datas.day
+        flags[:, -1] = (dias <= 5) | (dias >= 25)
+        return flags
+
+INDICE_EVENTOS = IndiceEventos(EVENTOS_SAZONAIS)
+
+class BufferVendas:
+    """
+    Buffer circular com as vendas diárias mais recentes de uma série (filial, sku).
+
+    Mantém a soma corrente de cada janela de média móvel, de modo que a média de qualquer
+    janela é servida em O(1), independentemente do tamanho do histórico.
+    """
+    def __init__(self, janelas=JANELAS_MEDIA_MOVEL):
+        self.janelas = tuple(janelas)
+        self.valores = [0.0] * max(self.janelas)
+        self.posicao_ultimo = -1
+        self.n_registros = 0
+        self.ultima_data = None
+        self.somas = {janela: 0.0 for janela in self.janelas}
+
+    def _recente(self, k):
+        """Retorna o k-ésimo valor mais recente (k=1 é o último)."""
+        return self.valores[(self.posicao_ultimo - k + 1) % len(self.valores)]
+
+    def adicionar(self, data, kg):
+        """
+        Registra a venda de um dia. Cada venda ocupa um registro, mesmo que repita a data do
+        último, como as linhas do CSV nas médias móveis do treino (medias_moveis).
+
+        Returns:
+            bool: False se a data for anterior ao último registro (o buffer não aceita
+            inserções fora de ordem), True caso contrário.
+        """
+        if self.ultima_data is not None and data < self.ultima_data:
+            return False
+        for janela in self.janelas:
+            if self.n_registros >= janela:
+                self.somas[janela] -= self._recente(janela)
+            self.somas[janela] += kg
+        self.posicao_ultimo = (self.posicao_ultimo + 1) % len(self.valores)
+        self.valores[self.posicao_ultimo] = kg
+        self.n_registros += 1
+        self.ultima_data = data
+        return True
+
+    def medias(self):
+        """Retorna as médias de cada janela seguidas do número de registros."""
+        if self.n_registros == 0:
+            return [0.0] * len(self.janelas) + [0]
+        return [self.somas[j] / min(self.n_registros, j) for j in self.janelas] + [self.n_registros]
+
+# Versão do formato do armazém de features (armazem_features/)
+VERSAO_ARMAZEM_FEATURES = 2
+
+class ArmazemFeatures:
+    """
+    Armazém persistente, só de acréscimo, das features de treino: uma linha por venda diária,
+    identificada por (data_dia, sku, filial), com cada coluna num arquivo binário tipado que
+    é aberto com np.memmap.
+
+    A cada sincronização apenas os dias posteriores ao último dia armazenado são calculados
+    (calendário, eventos e médias móveis, estas a partir do fim de cada série já armazenada)
+    e acrescentados ao fim dos arquivos. Se as vendas já armazenadas mudarem no CSV, ou se a
+    definição das features mudar, o armazém é reconstruído do zero.
+
+    Os arquivos ficam numa subpasta indicada pelo meta.json. O acréscimo grava depois das
+    linhas já mapeadas, sem alterá-las; a reconstrução usa uma subpasta nova e mantém a
+    anterior, que o aplicativo pode estar lendo com memory mapping (como em
+    salvar_artefato_modelo).
+    """
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+
+    @staticmethod
+    def colunas():
+        """(nome, dtype) de cada coluna armazenada; sku e filial são códigos das categorias do meta.json."""
+        return (
+            [('data_dia', 'int64'), ('sku', 'int32'), ('filial', 'int32'), ('total_venda_dia_kg', 'float32'),
+             ('dia_semana', 'int8'), ('mes', 'int8'), ('trimestre', 'int8')]
+            + [(col, 'int8') for col in INDICE_EVENTOS.colunas]
+            + [(nome_coluna_media(j), 'float64') for j in JANELAS_MEDIA_MOVEL]
+        )
+
+    @staticmethod
+    def definicao():
+        """Hash da definição das features: muda se as colunas, as janelas ou os eventos mudarem."""
+        eventos = {
+            evento: [[str(d) for d in sorted(info['datas'])], info['antecedencia_dias']]
+            for evento, info in EVENTOS_SAZONAIS.items()
+        }
+        conteudo = json.dumps({'colunas': ArmazemFeatures.colunas(), 'eventos': eventos}, sort_keys=True)
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+    def _caminho(self, pasta, nome):
+        return os.path.join(self.diretorio, pasta, f'{nome}.bin')
+
+    def _ler_meta_gravado(self):
+        try:
+            with open(os.path.join(self.diretorio, 'meta.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def ler_meta(self):
+        """Retorna o meta.json do armazém, ou None se não existir ou for de outra versão/definição."""
+        meta = self._ler_meta_gravado()
+        if meta is None or meta.get('versao') != VERSAO_ARMAZEM_FEATURES or meta.get('definicao') != self.definicao():
+            return None
+        return meta
+
+    def _gravar_meta(self, diretorio, meta):
+        temporario = os.path.join(diretorio, f'meta.json.tmp-{os.getpid()}')
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temporario, os.path.join(diretorio, 'meta.json'))
+
+    def abrir(self, meta):
+        """Abre as colunas armazenadas com memory mapping (somente leitura), limitadas a meta['n_linhas']."""
+        n = meta['n_linhas']
+        return {
+            nome: np.memmap(self._caminho(meta['pasta'], nome), dtype=tipo, mode='r', shape=(n,)) if n else np.zeros(0, dtype=tipo)
+            for nome, tipo in self.colunas()
+        }
+
+    @staticmethod
+    def _vendas_chave(vendas):
+        """data, sku, filial (FILIAL_GLOBAL quando o CSV não tem filial) e kg, na ordem de `vendas`."""
+        vendas = vendas[vendas['data_dia'].notna()]
+        filial = vendas['filial'].astype(str) if 'filial' in vendas.columns else FILIAL_GLOBAL
+        return pd.DataFrame({
+            'data_dia': vendas['data_dia'].to_numpy(dtype='datetime64[ns]'),
+            'sku': vendas['sku'].astype(str).to_numpy(),
+            'filial': filial if isinstance(filial, str) else filial.to_numpy(),
+            'total_venda_dia_kg': vendas['total_venda_dia_kg'].to_numpy(dtype=np.float32),
+        })
+
+    @staticmethod
+    def _hash(vendas):
+        return hashlib.sha256(pd.util.hash_pandas_object(vendas, index=False).to_numpy().tobytes()).hexdigest()
+
+    @staticmethod
+    def _calcular(novas, historico=None):
+        """
+        Calcula as features das linhas `novas` (em ordem de data). `historico` traz as últimas
+        linhas já armazenadas de cada série e só entra no cálculo das médias móveis.
+        """
+        base = novas if historico is None else pd.concat([historico, novas], ignore_index=True)
+        # Médias em float64 (não no float32 do kg), para que o resultado não dependa de
+        # quanto histórico entrou na soma acumulada
+        base = base.assign(total_venda_dia_kg=base['total_venda_dia_kg'].astype(np.float64))
+        medias = medias_moveis(base).iloc[len(base) - len(novas):]
+
+        datas = pd.DatetimeIndex(novas['data_dia'])
+        colunas = {
+            'data_dia': datas.asi8,
+            'total_venda_dia_kg': novas['total_venda_dia_kg'].to_numpy(),
+            'dia_semana': datas.weekday,
+            'mes': datas.month,
+            'trimestre': datas.quarter,
+        }
+        flags = INDICE_EVENTOS.calcular(datas)
+        for j, col in enumerate(INDICE_EVENTOS.colunas):
+            colunas[col] = flags[:, j]
+        for col in medias.columns:
+            colunas[col] = medias[col].to_numpy()
+        return colunas
+
+    @staticmethod
+    def _codificar(valores, categorias):
+        """Códigos de `valores` em `categorias`, acrescentando (em ordem de aparição) as que faltarem."""
+        for valor in pd.unique(valores):
+            if valor not in categorias:
+                categorias.append(valor)
+        return pd.Categorical(valores, categories=categorias).codes.astype(np.int32)
+
+    def _gravar_colunas(self, pasta, colunas, n_existentes):
+        """Acrescenta `colunas` aos arquivos da `pasta`, depois das `n_existentes` linhas."""
+        for nome, tipo in self.colunas():
+            caminho = self._caminho(pasta, nome)
+            tamanho = n_existentes * np.dtype(tipo).itemsize
+            with open(caminho, 'ab') as f:
+                if os.path.getsize(caminho) != tamanho:
+                    # Restos de uma gravação interrompida (depois do último meta.json válido)
+                    f.truncate(tamanho)
+                f.write(np.ascontiguousarray(colunas[nome], dtype=tipo).tobytes())
+
+    def _reconstruir(self, vendas):
+        anterior = self._ler_meta_gravado()
+        pasta = f"v{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+        os.makedirs(os.path.join(self.diretorio, pasta))
+        categorias = {'sku': [], 'filial': []}
+        colunas = self._calcular(vendas)
+        for chave in categorias:
+            colunas[chave] = self._codificar(vendas[chave].to_numpy(), categorias[chave])
+        self._gravar_colunas(pasta, colunas, 0)
+        self._gravar_meta(self.diretorio, {
+            'versao': VERSAO_ARMAZEM_FEATURES,
+            'definicao': self.definicao(),
+            'pasta': pasta,
+            'n_linhas': len(vendas),
+            'ultima_data': str(vendas['data_dia'].max()) if len(vendas) else None,
+            'hash': self._hash(vendas),
+            'categorias': categorias,
+        })
+        # Versões mais antigas que a anterior; as ainda mapeadas (Windows) ficam para a próxima
+        manter = {pasta, (anterior or {}).get('pasta')}
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            if nome in manter:
+                continue
+            if os.path.isdir(caminho):
+                shutil.rmtree(caminho, ignore_errors=True)
+            elif nome.endswith('.bin'):
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+
+    def _acrescentar(self, meta, vendas, novas):
+        armazenado = self.abrir(meta)
+        categorias = meta['categorias']
+        # Últimas linhas de cada série armazenada, suficientes para as médias móveis
+        cauda = pd.DataFrame({campo: armazenado[campo] for campo in ('sku', 'filial', 'total_venda_dia_kg')})
+        cauda = cauda.groupby(['filial', 'sku'], sort=False).tail(max(JANELAS_MEDIA_MOVEL))
+        historico = pd.DataFrame({
+            'data_dia': armazenado['data_dia'][cauda.index].view('datetime64[ns]'),
+            'sku': np.asarray(categorias['sku'], dtype=object)[cauda['sku'].to_numpy()],
+            'filial': np.asarray(categorias['filial'], dtype=object)[cauda['filial'].to_numpy()],
+            'total_venda_dia_kg': cauda['total_venda_dia_kg'].to_numpy(),
+        })
+        colunas = self._calcular(novas, historico)
+        for chave in ('sku', 'filial'):
+            colunas[chave] = self._codificar(novas[chave].to_numpy(), categorias[chave])
+        self._gravar_colunas(meta['pasta'], colunas, meta['n_linhas'])
+        self._gravar_meta(self.diretorio, {
+            **meta,
+            'n_linhas': len(vendas),
+            'ultima_data': str(vendas['data_dia'].max()),
+            'hash': self._hash(vendas),
+            'categorias': categorias,
+        })
+
+    def sincronizar(self, vendas):
+        """
+        Garante que o armazém contenha as features de todas as `vendas` (ordenadas por data),
+        calculando só os dias posteriores ao último armazenado.
+
+        Returns:
+            int: Número de linhas calculadas nesta chamada.
+        """
+        vendas = self._vendas_chave(vendas)
+        meta = self.ler_meta()
+        if meta is not None and meta['n_linhas'] > 0:
+            antigas = (vendas['data_dia'] <= pd.Timestamp(meta['ultima_data'])).to_numpy()
+            # Como as vendas estão em ordem de data, as antigas formam um prefixo
+            if antigas.sum() == meta['n_linhas'] and self._hash(vendas[antigas]) == meta['hash']:
+                novas = vendas[~antigas].reset_index(drop=True)
+                if novas.empty:
+                    return 0
+                try:
+                    self._acrescentar(meta, vendas, novas)
+                    return len(novas)
+                except OSError as e:
+                    # Ex.: restos a descartar num arquivo mapeado por outro processo (Windows)
+                    print(f"Armazém de features reconstruído em uma nova versão: {e}")
+        self._reconstruir(vendas)
+        return len(vendas)
+
+    def carregar(self):
+        """
+        Retorna as features armazenadas como DataFrame sobre os memmaps (sem copiar as colunas
+        numéricas), com sku e filial categóricos (categorias em ordem alfabética).
+        """
+        meta = self.ler_meta()
+        colunas = self.abrir(meta)
+        dados = {}
+        for nome, _ in self.colunas():
+            if nome == 'data_dia':
+                dados[nome] = colunas[nome].view('datetime64[ns]')
+            elif nome in ('sku', 'filial'):
+                categorias = meta['categorias'][nome]
+                dados[nome] = pd.Categorical.from_codes(colunas[nome], categories=categorias).reorder_categories(sorted(categorias))
+            else:
+                dados[nome] = colunas[nome]
+        return pd.DataFrame(dados, copy=False)
+
+# Versão do formato do diretório do modelo (cabecalho.json + arrays .npy + sklearn comprimido)
+VERSAO_ARTEFATO_MODELO = 1
+
+def salvar_artefato_modelo(diretorio, cabecalho, modelo, floresta):
+    """
+    Grava o modelo como um diretório:
+
+    - `cabecalho.json`: versão do formato, features e metadados do treino, legível sem
+      carregar a floresta;
+    - uma subpasta com um .npy por array da FlorestaNumpy, que os processos de previsão
+      abrem com memory mapping (uma única cópia física compartilhada entre eles), e o
+      RandomForestRegressor comprimido, lido apenas para re-treino.
+
+    Cada gravação usa uma subpasta nova e só então troca o cabeçalho. A subpasta da versão
+    anterior é mantida: quem ainda estiver com o cabeçalho anterior continua lendo a
+    floresta mapeada e pode carregar o modelo do sklearn dela sob demanda. Só as versões
+    mais antigas são apagadas; as que ainda estiverem em uso (Windows não apaga arquivos
+    mapeados) ficam para a próxima gravação.
+
+    Returns:
+        dict: O cabeçalho gravado.
+    """
+    anterior = ler_cabecalho_modelo(diretorio)
+    versao = f"v{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+    pasta = os.path.join(diretorio, versao)
+    os.makedirs(pasta)
+    for campo, valores in floresta.arrays().items():
+        if campo in FlorestaNumpy.CAMPOS:
+            np.save(os.path.join(pasta, f'{campo}.npy'), np.ascontiguousarray(valores))
+    import joblib
+    joblib.dump(modelo, os.path.join(pasta, 'modelo_sklearn.pkl.z'), compress=3)
+
+    cabecalho = {
+        **cabecalho,
+        'versao': VERSAO_ARTEFATO_MODELO,
+        'pasta': versao,
+        'profundidade': floresta.profundidade,
+        'n_arvores': floresta.n_arvores,
+        'n_nos': len(floresta.valor),
+    }
+    caminho_cabecalho = os.path.join(diretorio, 'cabecalho.json')
+    with open(caminho_cabecalho + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(cabecalho, f, indent=4, ensure_ascii=False)
+    os.replace(caminho_cabecalho + '.tmp', caminho_cabecalho)
+
+    manter = {versao, anterior['pasta'] if anterior else None}
+    for nome in os.listdir(diretorio):
+        if nome not in manter and os.path.isdir(os.path.join(diretorio, nome)):
+            shutil.rmtree(os.path.join(diretorio, nome), ignore_errors=True)
+    return cabecalho
+
+def ler_cabecalho_modelo(diretorio):
+    """Lê o cabeçalho do modelo salvo em `diretorio`; None se não existir ou for de outra versão."""
+    try:
+        with open(os.path.join(diretorio, 'cabecalho.json'), encoding='utf-8') as f:
+            cabecalho = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cabecalho.get('versao') != VERSAO_ARTEFATO_MODELO:
+        return None
+    return cabecalho
+
+def carregar_floresta(diretorio, cabecalho):
+    """Abre os arrays da floresta com memory mapping (somente leitura)."""
+    pasta = os.path.join(diretorio, cabecalho['pasta'])
+    arrays = {campo: np.load(os.path.join(pasta, f'{campo}.npy'), mmap_mode='r') for campo in FlorestaNumpy.CAMPOS}
+    return FlorestaNumpy.de_arrays({**arrays, 'profundidade': cabecalho['profundidade']})
+
+def carregar_modelo_sklearn(diretorio, cabecalho):
+    import joblib
+    return joblib.load(os.path.join(diretorio, cabecalho['pasta'], 'modelo_sklearn.pkl.z'))
+
+# Colunas pelas quais o treino particionado pode separar os modelos
+PARTICOES_MODELO = ('filial', 'sku')
+# Acima deste número de linhas o predict em C do sklearn volta a ser mais rápido que a FlorestaNumpy
+# (ver `python benchmarks.py inferencia`).
+LIMITE_LINHAS_FLORESTA_NUMPY = 500
+
+def _treinar_particao(X, y, skus, features, hiperparametros, n_jobs, diretorio):
+    """Treina e salva o modelo de uma partição. Executado nos processos do pool."""
+    from sklearn.ensemble import RandomForestRegressor
+    modelo = RandomForestRegressor(**{**hiperparametros, 'oob_score': True}, n_jobs=n_jobs)
+    modelo.fit(pd.DataFrame(X, columns=features), y)
+    cabecalho = {
+        'features': features,
+        'hiperparametros': hiperparametros,
+        'metricas': PrevisorDemanda._metricas_fora_do_treino(y, modelo.oob_prediction_, skus, 'out-of-bag'),
+        'treinado_em': datetime.now().isoformat(timespec='seconds'),
+    }
+    salvar_artefato_modelo(diretorio, cabecalho, modelo, FlorestaNumpy.de_sklearn(modelo))
+    return diretorio
+
+def _avaliar_fold(X_treino, y_treino, X_teste, features, hiperparametros, n_jobs):
+    """Treina o modelo de um fold e prevê as linhas de teste. Executado nos processos do pool."""
+    from sklearn.ensemble import RandomForestRegressor
+    modelo = RandomForestRegressor(**hiperparametros, n_jobs=n_jobs)
+    modelo.fit(pd.DataFrame(X_treino, columns=features), y_treino)
+    return modelo.predict(pd.DataFrame(X_teste, columns=features))
+
+def _executar_folds(folds, features, hiperparametros, max_processos=None):
+    """Avalia os folds (em paralelo se max_processos != 1) e retorna as previsões de cada um, na ordem."""
+    max_processos = max_processos or os.cpu_count() or 1
+    if max_processos == 1 or len(folds) == 1:
+        return [
+            _avaliar_fold(f['X_treino'], f['y_treino'], f['X_teste'], features, hiperparametros, -1)
+            for f in folds
+        ]
+    n_processos = min(max_processos, len(folds))
+    n_jobs = max(1, (os.cpu_count() or 1) // n_processos)
+    with ProcessPoolExecutor(max_workers=n_processos) as pool:
+        futuros = [
+            pool.submit(_avaliar_fold, f['X_treino'], f['y_treino'], f['X_teste'], features, hiperparametros, n_jobs)
+            for f in folds
+        ]
+        return [futuro.result() for futuro in futuros]
+
+def caminho_registro_particoes(script_dir):
+    return os.path.join(script_dir, 'registro_particoes.json')
+
+def caminho_hiperparametros(script_dir):
+    return os.path.join(script_dir, 'hiperparametros.json')
+
+def carregar_hiperparametros(script_dir):
+    """HIPERPARAMETROS, atualizados com os escolhidos pela última busca (hiperparametros.json), se houver."""
+    hiperparametros = dict(HIPERPARAMETROS)
+    if os.path.exists(caminho_hiperparametros(script_dir)):
+        with open(caminho_hiperparametros(script_dir), encoding='utf-8') as f:
+            hiperparametros.update(json.load(f))
+    return hiperparametros
+
+CAMPOS_FOLD = ('X_treino', 'y_treino', 'X_teste', 'y_teste', 'n_registros')
+
+def salvar_folds(folds, diretorio):
+    """Grava as matrizes de cada fold como .npy, para serem abertas com memory mapping pelos processos da busca."""
+    temporario = f"{diretorio}.tmp-{os.getpid()}"
+    os.makedirs(temporario, exist_ok=True)
+    for k, fold in enumerate(folds):
+        for campo in CAMPOS_FOLD:
+            np.save(os.path.join(temporario, f'fold{k}_{campo}.npy'), fold[campo])
+    with open(os.path.join(temporario, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'n_folds': len(folds), 'cortes': [fold['corte'].isoformat() for fold in folds]}, f)
+    substituir_diretorio(temporario, diretorio)
+
+def _avaliar_candidato_fold(diretorio, k, features, hiperparametros, n_jobs, repeticoes_latencia=20):
+    """
+    Treina um candidato no fold `k` salvo por salvar_folds e o avalia. Executado nos processos do pool.
+
+    Returns:
+        tuple: (soma dos erros absolutos, número de previsões, custo da previsão (árvores x
+        profundidade da FlorestaNumpy), latência mediana em ms da previsão de um dia).
+    """
+    import time
+    from sklearn.ensemble import RandomForestRegressor
+    fold = {campo: np.load(os.path.join(diretorio, f'fold{k}_{campo}.npy'), mmap_mode='r') for campo in CAMPOS_FOLD}
+    modelo = RandomForestRegressor(**hiperparametros, n_jobs=n_jobs)
+    modelo.fit(pd.DataFrame(fold['X_treino'], columns=features), fold['y_treino'])
+    floresta = FlorestaNumpy.de_sklearn(modelo)
+    pred = PrevisorDemanda._aplicar_piso(floresta.prever(fold['X_teste']), fold['n_registros'])
+    erro_absoluto = np.abs(np.maximum(0, np.round(pred, 2)) - fold['y_teste']).sum()
+
+    # Latência da previsão diária: uma linha por SKU, como no app
+    amostra = np.asarray(fold['X_teste'][:sum(c.startswith('sku_') for c in features)])
+    tempos = []
+    for _ in range(repeticoes_latencia):
+        inicio = time.perf_counter()
+        floresta.prever(amostra)
+        tempos.append(time.perf_counter() - inicio)
+    return float(erro_absoluto), len(pred), floresta.n_arvores * floresta.profundidade, float(np.median(tempos) * 1000)
+
+# Número máximo de previsões guardadas no cache LRU de cada PrevisorDemanda
+CAPACIDADE_CACHE_PREVISOES = 10_000
+
+class CachePrevisoes:
+    """
+    Cache LRU limitado de previsões, com contadores de acertos e falhas.
+
+    As chaves incluem as versões do modelo e dos dados (ver PrevisorDemanda), de modo que
+    uma previsão nunca é servida para um modelo ou histórico diferente do que a gerou.
+    """
+    def __init__(self, capacidade=CAPACIDADE_CACHE_PREVISOES):
+        self.capacidade = capacidade
+        self._itens = OrderedDict()
+        self.acertos = 0
+        self.falhas = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    def obter(self, chave):
+        """Retorna o valor guardado para `chave` (e o marca como recente) ou None."""
+        valor = self._itens.get(chave)
+        if valor is None:
+            self.falhas += 1
+            return None
+        self._itens.move_to_end(chave)
+        self.acertos += 1
+        return valor
+
+    def guardar(self, chave, valor):
+        self._itens[chave] = valor
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.capacidade:
+            self._itens.popitem(last=False)
+
+    def limpar(self):
+        self._itens.clear()
+
+    def estatisticas(self):
+        consultas = self.acertos + self.falhas
+        return {
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'itens': len(self._itens),
+            'taxa_acerto': self.acertos / consultas if consultas else 0.0,
+        }
+
 class PrevisorDemanda:
-    def __init__(self, script_dir):
+    def __init__(self, script_dir, janela_treino_dias=JANELA_TREINO_DIAS):
         self.dados_vendas = None
+        self.cabecalho_modelo = None
         self.modelo = None
+        self.floresta = None
+        self.janelas_treino = []
         self.script_dir = script_dir
+        self.hiperparametros = carregar_hiperparametros(script_dir)
+        self.janela_treino_dias = janela_treino_dias
+        self.hash_dados = None
+        self.particao = None
+        self.modelos_particao = {}
+        self._historico = None
+        self._vendas_recentes = None
+        # Versões que compõem a chave do cache de previsões; mudam a cada modelo novo
+        # (treino ou carga) e a cada mudança no histórico de vendas
+        self.versao_modelo = 0
+        self.versao_dados = 0
+        self.cache_previsoes = CachePrevisoes()
+
+    def _modelo_alterado(self):
+        self.versao_modelo += 1
+        self.cache_previsoes.limpar()
+
+    def _dados_alterados(self):
+        self._historico = None
+        self._vendas_recentes = None
+        self.versao_dados += 1
+        self.cache_previsoes.limpar()
 
     def carregar_dados_vendas(self, filepath):
-        self.dados_vendas = pd.read_csv(filepath, sep=';', encoding='latin1')
-        self.dados_vendas.columns = self.dados_vendas.columns.str.strip().str.lower()
-        self.dados_vendas['data_dia'] = pd.to_datetime(self.dados_vendas['data_dia'], dayfirst=True, errors='coerce')
-        self.dados_vendas.rename(columns={'id_produto': 'sku'}, inplace=True)
-        self.dados_vendas = self.dados_vendas.sort_values(by='data_dia').reset_index(drop=True)
+        self.hash_dados = hash_arquivo(filepath)
+        diretorio_cache = os.path.join(self.script_dir, 'cache_vendas')
+        # O cache já é gravado ordenado por data: na carga por ele, os arrays mapeados são
+        # usados como estão, sem a cópia de um sort_values
+        self.dados_vendas = carregar_cache_colunar(diretorio_cache, self.hash_dados)
+        if self.dados_vendas is None:
+            self.dados_vendas = ler_vendas_csv(filepath).sort_values(by='data_dia', kind='stable').reset_index(drop=True)
+            salvar_cache_colunar(self.dados_vendas, diretorio_cache, self.hash_dados)
+        self._dados_alterados()
 
-        N_DIAS = 180  # Use apenas os últimos 180 dias
-        if len(self.dados_vendas) > N_DIAS:
-            self.dados_vendas = self.dados_vendas.iloc[-N_DIAS:]
+    def caminho_armazem_features(self):
+        return os.path.join(self.script_dir, 'armazem_features')
 
     def preparar_features(self):
-        df = self.dados_vendas.copy()
-        df['dia_semana'] = df['data_dia'].dt.weekday
-        df['mes'] = df['data_dia'].dt.month
-        df['trimestre'] = df['data_dia'].dt.quarter
-
-        # Sazonalidade e pagamento
-        for evento, info in EVENTOS_SAZONAIS.items():
-            col_name = f'eh_{evento.lower().replace(" ", "_")}_prox'
-            df[col_name] = df['data_dia'].apply(
-                lambda d: int(any((data_evento - timedelta(days=info['antecedencia_dias']) <= d <= data_evento) for data_evento in info['datas']))
-            )
-        df['eh_pagamento_prox'] = df['data_dia'].apply(lambda d: int((1 <= d.day <= 5) or (d.day >= 25)))
-
-        # Médias móveis
-        for sku in df['sku'].unique():
-            mask = df['sku'] == sku
-            df.loc[mask, 'media_7d'] = df.loc[mask, 'total_venda_dia_kg'].rolling(7, min_periods=1).mean()
-            df.loc[mask, 'media_14d'] = df.loc[mask, 'total_venda_dia_kg'].rolling(14, min_periods=1).mean()
-        df['media_7d'] = df['media_7d'].fillna(0.0)
-        df['media_14d'] = df['media_14d'].fillna(0.0)
+        """
+        Monta a matriz de features a partir do armazém de features (armazem_features/): só os
+        dias novos do CSV são calculados e acrescentados; o resto é lido com memory mapping.
+        """
+        armazem = ArmazemFeatures(self.caminho_armazem_features())
+        n_calculadas = armazem.sincronizar(self.dados_vendas)
+        if n_calculadas:
+            print(f"Armazém de features: {n_calculadas} linhas calculadas.")
+        df = armazem.carregar()
+        if 'filial' not in self.dados_vendas.columns:
+            df = df.drop(columns='filial')
+
+        # Mantém apenas os últimos `janela_treino_dias` dias de cada série (filial, sku),
+        # para que a quantidade de histórico por SKU não dependa de quantos SKUs existem.
+        # O armazém guarda o histórico completo: as médias móveis do início da janela
+        # continuam vendo os dias anteriores a ela.
+        if self.janela_treino_dias is not None:
+            chaves = [c for c in ('filial', 'sku') if c in df.columns]
+            ultima_venda = df.groupby(chaves, observed=True)['data_dia'].transform('max')
+            inicio_janela = ultima_venda - pd.Timedelta(days=self.janela_treino_dias)
+            df = df[df['data_dia'] > inicio_janela].reset_index(drop=True)
+
         df = pd.get_dummies(df, columns=['sku'], prefix='sku')
         self.dados_vendas = df
+        self._dados_alterados()
+
+    @property
+    def modelo(self):
+        """
+        RandomForestRegressor treinado. Quando o modelo vem do disco, só é desserializado no
+        primeiro acesso (re-treino incremental, lotes grandes); as previsões usam `floresta`.
+        """
+        if self._modelo is None and self.cabecalho_modelo is not None:
+            self._modelo = carregar_modelo_sklearn(self.caminho_modelo(), self.cabecalho_modelo)
+        return self._modelo
+
+    @modelo.setter
+    def modelo(self, modelo):
+        self._modelo = modelo
+
+    def caminho_modelo(self):
+        return os.path.join(self.script_dir, 'modelo_demanda')
+
+    def chave_cache_modelo(self):
+        """
+        Chave do modelo treinado: hash do CSV de vendas, do schema e da definição das features
+        (datas e antecedência dos eventos, que não mudam os nomes das colunas), dos
+        hiperparâmetros e da janela de treino. Se nada mudou, o modelo salvo pode ser reutilizado.
+        """
+        conteudo = json.dumps({
+            'dados': self.hash_dados,
+            'features': self.colunas_features(),
+            'definicao_features': ArmazemFeatures.definicao(),
+            'hiperparametros': self.hiperparametros,
+            'janela_treino_dias': self.janela_treino_dias,
+        }, sort_keys=True)
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+    def _dados_para_treino(self, features):
+        return self.dados_vendas.dropna(subset=features + ['total_venda_dia_kg'])
+
+    def _salvar_artefato(self, features, metricas):
+        cabecalho = {
+            'chave': self.chave_cache_modelo(),
+            'features': features,
+            'hiperparametros': self.hiperparametros,
+            'janela_treino_dias': self.janela_treino_dias,
+            'janelas_treino': self.janelas_treino,
+            'metricas': metricas,
+            'treinado_em': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.cabecalho_modelo = salvar_artefato_modelo(self.caminho_modelo(), cabecalho, self.modelo, self.floresta)
+        self._modelo_alterado()
+
+    @staticmethod
+    def _metricas_fora_do_treino(y, y_pred, skus, origem):
+        """
+        Imprime e retorna (no formato gravado no cabeçalho do modelo) MAE, RMSE e MAPE gerais
+        e por SKU de previsões feitas sem as próprias linhas no treino: estimativas
+        out-of-bag ou uma janela recente ainda não vista pelo modelo.
+        """
+        resultados = pd.DataFrame({
+            'real': np.asarray(y, dtype=float),
+            'previsao': np.asarray(y_pred, dtype=float),
+            'sku': np.asarray(skus),
+            'todos': '*',
+        })
+        geral = PrevisorDemanda.metricas_backtest(resultados, por=('todos',)).iloc[0]
+        por_sku = PrevisorDemanda.metricas_backtest(resultados, por=('sku',))
+
+        print(f"Métricas ({origem}):")
+        print(f"MAE: {geral['mae']:.2f}")
+        print(f"RMSE: {geral['rmse']:.2f}")
+        print(f"MAPE: {geral['mape']:.2f}%")
+        print(por_sku.round(2).to_string())
+        return {
+            'origem': origem,
+            'geral': {nome: float(valor) for nome, valor in geral.items()},
+            'por_sku': {str(sku): {nome: float(valor) for nome, valor in linha.items()} for sku, linha in por_sku.iterrows()},
+        }
+
+    @staticmethod
+    def _janela_treino(dados, primeira_arvore, ultima_arvore):
+        return {
+            'inicio': dados['data_dia'].min().isoformat(),
+            'fim': dados['data_dia'].max().isoformat(),
+            'n_linhas': len(dados),
+            'arvores': [primeira_arvore, ultima_arvore],
+        }
 
     def treinar_modelo(self):
-        sku_cols = [col for col in self.dados_vendas.columns if col.startswith('sku_')]
-        features = [
-            'dia_semana', 'mes', 'trimestre', 'media_7d', 'media_14d'
-        ] + sku_cols + [f'eh_{e.lower().replace(" ", "_")}_prox' for e in EVENTOS_SAZONAIS] + ['eh_pagamento_prox']
-        dados_para_treino = self.dados_vendas.dropna(subset=features + ['total_venda_dia_kg'])
+        features = self.colunas_features()
+        dados_para_treino = self._dados_para_treino(features)
         X = dados_para_treino[features]
         y = dados_para_treino['total_venda_dia_kg']
-        self.modelo = RandomForestRegressor(n_estimators=150, max_depth=8, random_state=42, n_jobs=-1)
+        from sklearn.ensemble import RandomForestRegressor
+        self.modelo = RandomForestRegressor(**{**self.hiperparametros, 'oob_score': True}, n_jobs=-1)
         self.modelo.fit(X, y)
-        joblib.dump(self.modelo, os.path.join(self.script_dir, 'modelo_demanda.pkl'))
+        self.floresta = FlorestaNumpy.de_sklearn(self.modelo)
+        self.janelas_treino = [self._janela_treino(dados_para_treino, 0, self.modelo.n_estimators)]
+
+        # Cada linha é prevista só pelas árvores que não a sortearam no bootstrap: uma
+        # estimativa honesta, calculada no próprio fit, sem outra passada de predict
+        skus = self._rotulos_particao(dados_para_treino, 'sku')
+        metricas = self._metricas_fora_do_treino(y, self.modelo.oob_prediction_, skus, 'out-of-bag')
+        self._salvar_artefato(features, metricas)
+
+    def treinar_incremental(self, n_arvores=20, max_arvores=None):
+        """
+        Acrescenta `n_arvores` à floresta atual (warm start) treinadas apenas com as vendas
+        posteriores ao fim da última janela de treino, em vez de refazer o modelo inteiro.
+
+        Cada bloco de árvores fica registrado em `janelas_treino` com o período de dados que
+        cobre. Se a floresta passar de `max_arvores` (padrão: 2x n_estimators), os blocos mais
+        antigos são descartados. Se não houver modelo com janelas registradas, ou se o schema
+        de features mudou (ex.: SKU novo), faz o treino completo.
+
+        Returns:
+            bool: True se houve treino (incremental ou completo), False se não havia dados novos.
+        """
+        if max_arvores is None:
+            max_arvores = 2 * self.hiperparametros['n_estimators']
+        features = self.colunas_features()
+        if self.floresta is None and ler_cabecalho_modelo(self.caminho_modelo()) is not None:
+            self.carregar_modelo()
+        if (self.modelo is None or not self.janelas_treino
+                or list(getattr(self.modelo, 'feature_names_in_', [])) != features):
+            print("Sem modelo compatível para treino incremental; executando treino completo.")
+            self.treinar_modelo()
+            return True
+
+        fim_anterior = pd.Timestamp(self.janelas_treino[-1]['fim'])
+        dados_para_treino = self._dados_para_treino(features)
+        novos = dados_para_treino[dados_para_treino['data_dia'] > fim_anterior]
+        if novos.empty:
+            print(f"Nenhuma venda nova desde {fim_anterior.date()}; modelo mantido.")
+            return False
+
+        X = novos[features]
+        y = novos['total_venda_dia_kg']
+        # As vendas novas ainda não foram vistas pelo modelo atual: avaliá-lo nelas antes de
+        # acrescentar as árvores mede a precisão numa janela recente, fora do treino
+        metricas = self._metricas_fora_do_treino(
+            y, self.floresta.prever(X.to_numpy(dtype=float)), self._rotulos_particao(novos, 'sku'), 'janela recente'
+        )
+        n_atual = len(self.modelo.estimators_)
+        self.modelo.set_params(warm_start=True, oob_score=False, n_estimators=n_atual + n_arvores)
+        self.modelo.fit(X, y)
+        self.modelo.set_params(warm_start=False)
+        self.janelas_treino.append(self._janela_treino(novos, n_atual, n_atual + n_arvores))
+
+        excesso = len(self.modelo.estimators_) - max_arvores
+        if excesso > 0:
+            self.modelo.estimators_ = self.modelo.estimators_[excesso:]
+            self.modelo.n_estimators = len(self.modelo.estimators_)
+            janelas = []
+            for janela in self.janelas_treino:
+                primeira, ultima = janela['arvores'][0] - excesso, janela['arvores'][1] - excesso
+                if ultima > 0:
+                    janelas.append({**janela, 'arvores': [max(primeira, 0), ultima]})
+            self.janelas_treino = janelas
+        self.floresta = FlorestaNumpy.de_sklearn(self.modelo)
 
-        y_pred = self.modelo.predict(X)
-        mae = mean_absolute_error(y, y_pred)
-        rmse = np.sqrt(mean_squared_error(y, y_pred))
-        mape = np.mean(np.abs((y - y_pred) / y[y != 0])) * 100
+        print(f"Treino incremental: {n_arvores} árvores com {len(novos)} linhas novas "
+              f"({novos['data_dia'].min().date()} a {novos['data_dia'].max().date()}).")
+        self._salvar_artefato(features, metricas)
+        return True
 
-        print(f"MAE: {mae:.2f}")
-        print(f"RMSE: {rmse:.2f}")
-        print(f"MAPE: {mape:.2f}%")
+    def _aplicar_cabecalho(self, cabecalho):
+        """Mapeia a floresta descrita pelo cabeçalho; o modelo do sklearn fica para o primeiro acesso."""
+        if self.dados_vendas is not None and 'sku' not in self.dados_vendas.columns:
+            # Features já preparadas: valida o schema pelo cabeçalho, antes de abrir a floresta
+            features = self.colunas_features()
+            if cabecalho['features'] != features:
+                raise ValueError(
+                    f"Modelo salvo incompatível com as features atuais "
+                    f"({len(cabecalho['features'])} x {len(features)} colunas)."
+                )
+        self.floresta = carregar_floresta(self.caminho_modelo(), cabecalho)
+        self.cabecalho_modelo = cabecalho
+        self.modelo = None
+        self.janelas_treino = cabecalho.get('janelas_treino', [])
+        self._modelo_alterado()
 
     def carregar_modelo(self):
-        self.modelo = joblib.load(os.path.join(self.script_dir, 'modelo_demanda.pkl'))
-
-    def prever_demanda(self, data_hoje, sku, valor_real=None):
-        data_previsao = data_hoje + timedelta(days=2)
-        dados_sku = self.dados_vendas[[col for col in self.dados_vendas.columns if not col.startswith('sku_')]]
-        media_7d = 0.0
-        media_14d = 0.0
-        sku_col_name = f'sku_{sku}'
-        if sku_col_name in self.dados_vendas.columns:
-            mask = self.dados_vendas[sku_col_name] == 1
-            dados_sku = self.dados_vendas[mask & (self.dados_vendas['data_dia'] < data_previsao)].sort_values(by='data_dia')
-            media_7d = dados_sku['total_venda_dia_kg'].tail(7).mean() if not dados_sku.empty else 0.0
-            media_14d = dados_sku['total_venda_dia_kg'].tail(14).mean() if not dados_sku.empty else 0.0
+        cabecalho = ler_cabecalho_modelo(self.caminho_modelo())
+        if cabecalho is None:
+            raise FileNotFoundError(f"Modelo não encontrado (ou de formato antigo) em {self.caminho_modelo()}")
+        self._aplicar_cabecalho(cabecalho)
 
-        valor_minimo = 10.0
-        historico_suficiente = len(dados_sku) >= 7
-
-        sazonalidade_features = {}
-        for evento, info in EVENTOS_SAZONAIS.items():
-            col_name = f'eh_{evento.lower().replace(" ", "_")}_prox'
-            sazonalidade_features[col_name] = int(any(
-                (data_evento - timedelta(days=info['antecedencia_dias']) <= data_previsao <= data_evento)
-                for data_evento in info['datas']
-            ))
-        sazonalidade_features['eh_pagamento_prox'] = int((1 <= data_previsao.day <= 5) or (data_previsao.day >= 25))
+    def carregar_ou_treinar_modelo(self):
+        """
+        Carrega o modelo salvo se a chave de cache coincidir com os dados, features e
+        hiperparâmetros atuais; caso contrário, treina e salva um novo modelo.
 
-        sku_cols = [col for col in self.dados_vendas.columns if col.startswith('sku_')]
-        sku_features = {col: 0 for col in sku_cols}
-        if sku_col_name in sku_features:
-            sku_features[sku_col_name] = 1
-
-        features_data = {
-            'dia_semana': data_previsao.weekday(),
-            'mes': data_previsao.month,
-            'trimestre': (data_previsao.month - 1) // 3 + 1,
-            'media_7d': media_7d,
-            'media_14d': media_14d,
-            **sku_features,
-            **sazonalidade_features
+        Returns:
+            bool: True se o modelo veio do cache, False se foi treinado.
+        """
+        # Só o cabeçalho é lido para decidir; a floresta é mapeada apenas no caso de acerto
+        cabecalho = ler_cabecalho_modelo(self.caminho_modelo())
+        if cabecalho is not None and cabecalho.get('chave') == self.chave_cache_modelo():
+            try:
+                self._aplicar_cabecalho(cabecalho)
+                print("Modelo carregado do cache (dados e parâmetros inalterados).")
+                return True
+            except Exception as e:
+                print(f"Não foi possível ler o modelo salvo: {e}")
+        self.treinar_modelo()
+        return False
+
+    def caminho_registro_particoes(self):
+        return caminho_registro_particoes(self.script_dir)
+
+    def _rotulos_particao(self, dados, particao, skus=None, filiais=None):
+        """Valor da partição de cada linha (filial ou SKU), como string."""
+        if particao == 'sku':
+            if skus is not None:
+                return np.array([str(sku) for sku in skus])
+            sku_cols = [col for col in dados.columns if col.startswith('sku_')]
+            return np.array([col[len('sku_'):] for col in sku_cols])[np.argmax(dados[sku_cols].to_numpy(), axis=1)]
+        if filiais is not None:
+            return np.array([str(filial) for filial in filiais])
+        if 'filial' in dados.columns:
+            return dados['filial'].astype(str).to_numpy()
+        return np.full(len(dados), FILIAL_GLOBAL)
+
+    def treinar_particionado(self, particao='filial', max_processos=None):
+        """
+        Treina um modelo por filial (ou por SKU) em um pool de processos, todos a partir da
+        mesma matriz de features. O registro `registro_particoes.json` guarda as features e o
+        hash do CSV do treino e associa cada partição ao arquivo do seu modelo e ao hash dos
+        dados com que foi treinado; partições cujos dados não mudaram não são re-treinadas.
+
+        Args:
+            particao (str): 'filial' ou 'sku'.
+            max_processos (int, optional): Tamanho do pool. Padrão: todos os núcleos.
+
+        Returns:
+            list: Partições que foram (re)treinadas.
+        """
+        if particao not in PARTICOES_MODELO:
+            raise ValueError(f"Partição inválida: {particao}. Use uma de {PARTICOES_MODELO}.")
+        features = self.colunas_features()
+        dados = self._dados_para_treino(features)
+        rotulos = self._rotulos_particao(dados, particao)
+        skus = self._rotulos_particao(dados, 'sku')
+        X = dados[features].to_numpy(dtype=float)
+        y = dados['total_venda_dia_kg'].to_numpy(dtype=float)
+
+        registro = {
+            'particao': particao, 'features': features, 'definicao_features': ArmazemFeatures.definicao(),
+            'hash_dados': self.hash_dados, 'modelos': {},
         }
-        features_treinamento = [
-            'dia_semana', 'mes', 'trimestre', 'media_7d', 'media_14d'
-        ] + sku_cols + [f'eh_{e.lower().replace(" ", "_")}_prox' for e in EVENTOS_SAZONAIS] + ['eh_pagamento_prox']
-        X_prever = pd.DataFrame([features_data])[features_treinamento]
-        if self.modelo is None:
-            self.carregar_modelo()
-        pred = self.modelo.predict(X_prever)[0]
+        if os.path.exists(self.caminho_registro_particoes()):
+            with open(self.caminho_registro_particoes(), encoding='utf-8') as f:
+                anterior = json.load(f)
+            if anterior.get('particao') == particao:
+                registro['modelos'] = anterior.get('modelos', {})
+
+        diretorio = os.path.join(self.script_dir, 'modelos_particionados')
+        os.makedirs(diretorio, exist_ok=True)
+        pendentes = {}
+        for valor in map(str, np.unique(rotulos)):
+            linhas = rotulos == valor
+            h = hashlib.sha256()
+            h.update(json.dumps({'features': features, 'hiperparametros': self.hiperparametros}, sort_keys=True).encode('utf-8'))
+            h.update(X[linhas].tobytes())
+            h.update(y[linhas].tobytes())
+            entrada = registro['modelos'].get(valor)
+            if (entrada and entrada['hash'] == h.hexdigest()
+                    and ler_cabecalho_modelo(os.path.join(self.script_dir, entrada['arquivo'])) is not None):
+                continue
+            nome_seguro = ''.join(c if c.isalnum() else '_' for c in valor)
+            arquivo = os.path.join('modelos_particionados', f"{particao}_{nome_seguro}")
+            pendentes[valor] = (linhas, arquivo, h.hexdigest())
+
+        if pendentes:
+            max_processos = max_processos or os.cpu_count() or 1
+            n_jobs = max(1, (os.cpu_count() or 1) // len(pendentes))
+            with ProcessPoolExecutor(max_workers=min(max_processos, len(pendentes))) as pool:
+                futuros = {
+                    valor: pool.submit(
+                        _treinar_particao, X[linhas], y[linhas], skus[linhas], features, self.hiperparametros,
+                        n_jobs, os.path.join(self.script_dir, arquivo)
+                    )
+                    for valor, (linhas, arquivo, _) in pendentes.items()
+                }
+                for valor, futuro in futuros.items():
+                    futuro.result()
+                    linhas, arquivo, hash_particao = pendentes[valor]
+                    registro['modelos'][valor] = {
+                        'arquivo': arquivo,
+                        'hash': hash_particao,
+                        'n_linhas': int(linhas.sum()),
+                        'treinado_em': datetime.now().isoformat(timespec='seconds'),
+                    }
+                    print(f"Partição {particao}={valor}: modelo treinado com {int(linhas.sum())} linhas.")
+
+        caminho_temporario = self.caminho_registro_particoes() + '.tmp'
+        with open(caminho_temporario, 'w', encoding='utf-8') as f:
+            json.dump(registro, f, indent=4, ensure_ascii=False)
+        os.replace(caminho_temporario, self.caminho_registro_particoes())
+        self.carregar_modelos_particionados()
+        return list(pendentes)
+
+    def carregar_modelos_particionados(self):
+        """
+        Carrega os modelos do registro de partições. A partir daí, cada linha prevista usa o
+        modelo da sua partição; linhas sem modelo próprio usam o modelo global.
+
+        Como em _aplicar_cabecalho, o schema é validado antes de abrir as florestas: partições
+        cujo cabeçalho tem outras features ficam de fora (suas linhas usam o modelo global).
+
+        Raises:
+            ValueError: Se o registro foi gerado com outras features (ex.: SKU novo, evento
+                com outras datas) ou outro CSV de vendas; nesse caso nenhum modelo particionado
+                é carregado.
+        """
+        with open(self.caminho_registro_particoes(), encoding='utf-8') as f:
+            registro = json.load(f)
+        features = self.colunas_features()
+        if (registro.get('features') != features or registro.get('hash_dados') != self.hash_dados
+                or registro.get('definicao_features') != ArmazemFeatures.definicao()):
+            raise ValueError(
+                "Registro de partições desatualizado (features ou dados de vendas mudaram); "
+                "re-treine com `python main.py --particionado ...`."
+            )
+        modelos = {}
+        for valor, entrada in registro['modelos'].items():
+            diretorio = os.path.join(self.script_dir, entrada['arquivo'])
+            cabecalho = ler_cabecalho_modelo(diretorio)
+            if cabecalho is None:
+                raise FileNotFoundError(f"Modelo da partição {valor} não encontrado em {diretorio}")
+            if cabecalho['features'] != features:
+                print(f"Partição {registro['particao']}={valor} ignorada: modelo incompatível com as features atuais "
+                      f"({len(cabecalho['features'])} x {len(features)} colunas).")
+                continue
+            modelos[valor] = carregar_floresta(diretorio, cabecalho)
+        self.particao = registro['particao']
+        self.modelos_particao = modelos
+        self._modelo_alterado()
+
+    def _florestas_por_linha(self, skus, filiais):
+        """
+        Separa as linhas pela floresta que as prevê: a da partição da linha, quando houver
+        modelos particionados, ou a do modelo global. Retorna uma lista de (floresta, linhas).
+        """
+        grupos = []
+        restantes = np.ones(len(skus), dtype=bool)
+        if self.particao is not None:
+            rotulos = self._rotulos_particao(None, self.particao, skus=skus, filiais=filiais)
+            if self.particao == 'filial':
+                # Filiais sem modelo próprio usam o modelo treinado com o histórico compartilhado
+                sem_modelo = ~np.isin(rotulos, list(self.modelos_particao))
+                rotulos[sem_modelo] = FILIAL_GLOBAL
+            for valor, floresta in self.modelos_particao.items():
+                linhas = rotulos == valor
+                if linhas.any():
+                    grupos.append((floresta, linhas))
+                    restantes &= ~linhas
+        if restantes.any():
+            if self.floresta is None:
+                self.carregar_modelo()
+            grupos.append((self.floresta, restantes))
+        return grupos
+
+    def _prever_matriz(self, X, skus, filiais):
+        """
+        Executa o predict da matriz X com a FlorestaNumpy exportada do modelo, separando as
+        linhas por partição quando houver modelos particionados.
+        """
+        pred = np.zeros(len(X))
+        for floresta, linhas in self._florestas_por_linha(skus, filiais):
+            if floresta is self.floresta and linhas.sum() > LIMITE_LINHAS_FLORESTA_NUMPY:
+                pred[linhas] = self.modelo.predict(pd.DataFrame(X[linhas], columns=self.colunas_features()))
+            else:
+                pred[linhas] = floresta.prever(X[linhas])
+        return pred
+
+    def _quantis_matriz(self, X, skus, filiais, quantis):
+        """
+        Quantis (em %) das previsões das árvores para cada linha de X, calculados de uma vez
+        sobre a matriz (árvores x linhas) de cada floresta. Retorna (len(X), len(quantis)).
+        """
+        bandas = np.zeros((len(X), len(quantis)))
+        for floresta, linhas in self._florestas_por_linha(skus, filiais):
+            bandas[linhas] = np.percentile(floresta.prever_por_arvore(X[linhas]), quantis, axis=0).T
+        return bandas
+
+    def colunas_features(self):
+        sku_cols = [col for col in self.dados_vendas.columns if col.startswith('sku_')]
+        return [
+            'dia_semana', 'mes', 'trimestre'
+        ] + [nome_coluna_media(j) for j in JANELAS_MEDIA_MOVEL] + sku_cols + INDICE_EVENTOS.colunas
+
+    def _indice_historico(self):
+        """
+        Monta (uma única vez por carga de dados) as séries de vendas ordenadas por data
+        para cada par (filial, sku), com a soma acumulada usada nas médias móveis. Cada linha
+        do CSV é um registro, como em medias_moveis.
+
+        As séries saem de uma única ordenação por (filial, sku, data), estável para manter a
+        ordem do CSV entre vendas da mesma data, em vez de uma máscara por série.
+        """
+        if self._historico is not None:
+            return self._historico
+        df = self.dados_vendas
+        sku_cols = [col for col in df.columns if col.startswith('sku_')]
+        self._historico = {}
+        if not sku_cols:
+            return self._historico
+        one_hot = df[sku_cols].to_numpy(dtype=bool)
+        validas = (one_hot.any(axis=1) & df['data_dia'].notna().to_numpy()
+                   & df['total_venda_dia_kg'].notna().to_numpy())
+        codigos_sku = one_hot.argmax(axis=1)[validas]
+        if 'filial' in df.columns:
+            filiais, codigos_filial = np.unique(df['filial'].astype(str).to_numpy()[validas], return_inverse=True)
+        else:
+            filiais, codigos_filial = np.array([FILIAL_GLOBAL]), np.zeros(len(codigos_sku), dtype=np.int64)
+        datas = df['data_dia'].to_numpy(dtype='datetime64[ns]')[validas]
+        kg = df['total_venda_dia_kg'].to_numpy(dtype=float)[validas]
+
+        series = codigos_filial * len(sku_cols) + codigos_sku
+        ordem = np.lexsort((datas, series))
+        series, datas, kg = series[ordem], datas[ordem], kg[ordem]
+        inicios = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])
+        for inicio, fim in zip(inicios, np.r_[inicios[1:], len(series)]):
+            filial, sku_col = filiais[series[inicio] // len(sku_cols)], sku_cols[series[inicio] % len(sku_cols)]
+            acumulado = np.concatenate(([0.0], np.cumsum(kg[inicio:fim])))
+            self._historico[(str(filial), sku_col[len('sku_'):])] = (datas[inicio:fim], acumulado)
+        return self._historico
+
+    @staticmethod
+    def _buffer_da_serie(datas, acumulado):
+        buffer = BufferVendas()
+        inicio = max(len(datas) - len(buffer.valores), 0)
+        for data, kg in zip(datas[inicio:], np.diff(acumulado[inicio:])):
+            buffer.adicionar(data, kg)
+        buffer.n_registros = len(datas)
+        return buffer
+
+    def _estado_vendas_recentes(self):
+        """
+        Monta (uma única vez por carga de dados) um BufferVendas por par (filial, sku)
+        a partir do fim de cada série do histórico.
+        """
+        if self._vendas_recentes is None:
+            self._vendas_recentes = {
+                chave: self._buffer_da_serie(datas, acumulado)
+                for chave, (datas, acumulado) in self._indice_historico().items()
+            }
+        return self._vendas_recentes
+
+    def registrar_venda(self, data, sku, kg, filial=FILIAL_GLOBAL):
+        """
+        Registra uma nova venda diária (em kg) sem recarregar o CSV. API para integrações
+        que recebem as vendas do dia; o Frango_app não a utiliza.
+
+        A venda vai para a mesma série que as previsões da filial consultam: se a filial não
+        tem histórico próprio (ex.: CSV sem a coluna filial), a série compartilhada
+        (FILIAL_GLOBAL), como em _medias_ate. Cada chamada acrescenta um registro, depois dos
+        da mesma data, como uma nova linha do CSV. O buffer da série é atualizado em O(1); a
+        série do histórico recebe o registro com np.insert, em O(n) no tamanho da série.
+        """
+        historico = self._indice_historico()
+        buffers = self._estado_vendas_recentes()  # antes da inserção, para não contá-la duas vezes
+        chave = (str(filial), str(sku))
+        if chave not in historico and (FILIAL_GLOBAL, str(sku)) in historico:
+            chave = (FILIAL_GLOBAL, str(sku))
+        data = np.datetime64(data, 'ns')
+        datas, acumulado = historico.get(chave, (np.array([], dtype='datetime64[ns]'), np.zeros(1)))
+        posicao = int(np.searchsorted(datas, data, side='right'))
+        datas = np.insert(datas, posicao, data)
+        acumulado = np.insert(acumulado, posicao + 1, acumulado[posicao])
+        acumulado[posicao + 1:] += kg
+        historico[chave] = (datas, acumulado)
+
+        buffer = buffers.setdefault(chave, BufferVendas())
+        if not buffer.adicionar(data, kg):
+            # Venda retroativa: o buffer é reconstruído a partir da série atualizada
+            buffers[chave] = self._buffer_da_serie(datas, acumulado)
+        self.versao_dados += 1
+        self.cache_previsoes.limpar()
+
+    def _medias_ate(self, datas_previsao, skus, filiais):
+        """
+        Para cada linha (data_previsao, sku, filial), retorna as médias de cada janela de
+        JANELAS_MEDIA_MOVEL seguidas do número de registros, considerando apenas as vendas
+        anteriores a data_previsao.
+
+        As linhas são agrupadas por série; as datas posteriores ao último registro da série
+        (o caso comum, inclusive para todos os horizontes de uma mesma previsão) recebem o
+        estado O(1) do BufferVendas, e as demais usam uma única busca vetorizada na soma acumulada.
+        """
+        datas_previsao = np.asarray(datas_previsao, dtype='datetime64[ns]')
+        medias = np.zeros((len(datas_previsao), len(JANELAS_MEDIA_MOVEL) + 1))
+        buffers = self._estado_vendas_recentes()
+        historico = self._indice_historico()
+
+        linhas_por_serie = {}
+        for i, (sku, filial) in enumerate(zip(skus, filiais)):
+            chave = (str(filial), str(sku))
+            if chave not in historico:
+                chave = (FILIAL_GLOBAL, str(sku))
+            linhas_por_serie.setdefault(chave, []).append(i)
+
+        for chave, linhas in linhas_por_serie.items():
+            if chave not in historico:
+                continue
+            linhas = np.array(linhas)
+            datas_linhas = datas_previsao[linhas]
+            buffer = buffers.get(chave)
+            if buffer is not None and buffer.ultima_data is not None:
+                pelo_buffer = datas_linhas > buffer.ultima_data
+                medias[linhas[pelo_buffer]] = buffer.medias()
+                linhas, datas_linhas = linhas[~pelo_buffer], datas_linhas[~pelo_buffer]
+            if len(linhas) == 0:
+                continue
+
+            datas, acumulado = historico[chave]
+            n = np.searchsorted(datas, datas_linhas, side='left')
+            for j, janela in enumerate(JANELAS_MEDIA_MOVEL):
+                soma = acumulado[n] - acumulado[np.maximum(n - janela, 0)]
+                medias[linhas, j] = np.where(n > 0, soma / np.maximum(np.minimum(n, janela), 1), 0.0)
+            medias[linhas, -1] = n
+        return medias
+
+    def _matriz_features(self, datas_previsao, skus, filiais, datas_corte=None):
+        """
+        Monta a matriz de features (na ordem de colunas_features) para as linhas
+        (data_previsao, sku, filial). Retorna (X, n_registros).
+
+        As médias móveis usam as vendas anteriores a `datas_corte` (padrão: a própria
+        data_previsao); o backtest passa o dia seguinte à data em que a previsão seria feita.
+        """
+        features = self.colunas_features()
+        posicao = {col: i for i, col in enumerate(features)}
+        X = np.zeros((len(datas_previsao), len(features)))
+        datas_previsao = pd.DatetimeIndex(datas_previsao)
+        skus = [str(sku) for sku in skus]
 
-        if not historico_suficiente:
-            pred = max(pred, valor_minimo)
+        # Calendário e eventos calculados uma vez por data distinta
+        datas_unicas, inversa = np.unique(datas_previsao.values, return_inverse=True)
+        datas_unicas = pd.DatetimeIndex(datas_unicas)
+        X[:, posicao['dia_semana']] = datas_unicas.weekday[inversa]
+        X[:, posicao['mes']] = datas_unicas.month[inversa]
+        X[:, posicao['trimestre']] = datas_unicas.quarter[inversa]
+        X[:, [posicao[col] for col in INDICE_EVENTOS.colunas]] = INDICE_EVENTOS.calcular(datas_unicas)[inversa]
+
+        # One-hot do SKU
+        linhas_sku = [i for i, sku in enumerate(skus) if f'sku_{sku}' in posicao]
+        X[linhas_sku, [posicao[f'sku_{skus[i]}'] for i in linhas_sku]] = 1
+
+        medias = self._medias_ate(datas_previsao if datas_corte is None else datas_corte, skus, filiais)
+        X[:, [posicao[nome_coluna_media(j)] for j in JANELAS_MEDIA_MOVEL]] = medias[:, :-1]
+        return X, medias[:, -1]
+
+    def _prever_datas(self, datas_previsao, skus, filiais):
+        """
+        Previsões sem arredondamento para as linhas (data_previsao, sku, filial). As que não
+        estão no cache de previsões são calculadas juntas, com um único predict.
+        """
+        # O corte das médias móveis e as janelas de eventos comparam o instante exato, mas com
+        # vendas diárias (à meia-noite) só distinguem a meia-noite do resto do dia: às 10:00 as
+        # vendas do próprio dia já contam. A chave é o dia mais essa distinção, e não o horário.
+        datas_previsao = pd.DatetimeIndex(datas_previsao)
+        dias = datas_previsao.normalize()
+        chaves = [
+            (dia, bool(data != dia), str(sku), str(filial), self.versao_modelo, self.versao_dados)
+            for data, dia, sku, filial in zip(datas_previsao, dias, skus, filiais)
+        ]
+        pred = np.empty(len(chaves))
+        faltantes = {}  # chave -> linhas que a pedem (uma mesma chave é calculada uma única vez)
+        for i, chave in enumerate(chaves):
+            if chave in faltantes:
+                faltantes[chave].append(i)
+                continue
+            valor = self.cache_previsoes.obter(chave)
+            if valor is None:
+                faltantes[chave] = [i]
+            else:
+                pred[i] = valor
+        if faltantes:
+            novas_chaves = list(faltantes)
+            skus_faltantes = [chave[2] for chave in novas_chaves]
+            filiais_faltantes = [chave[3] for chave in novas_chaves]
+            X, n_registros = self._matriz_features(
+                datas_previsao[[faltantes[chave][0] for chave in novas_chaves]], skus_faltantes, filiais_faltantes
+            )
+            novas = self._aplicar_piso(self._prever_matriz(X, skus_faltantes, filiais_faltantes), n_registros)
+            for chave, valor in zip(novas_chaves, novas):
+                pred[faltantes[chave]] = valor
+                self.cache_previsoes.guardar(chave, float(valor))
+        return pred
+
+    @staticmethod
+    def _aplicar_piso(pred, n_registros):
+        """Séries com menos de 7 dias de histórico recebem no mínimo 10 kg (pred: 1 linha por série)."""
+        valor_minimo = 10.0
+        historico_insuficiente = n_registros < 7
+        pred[historico_insuficiente] = np.maximum(pred[historico_insuficiente], valor_minimo)
+        return pred
+
+    def _prever_bruto(self, chaves):
+        """Previsões de D+HORIZONTE_PREVISAO_DIAS, sem arredondamento, para as chaves (data_hoje, sku, filial)."""
+        datas_previsao = [data_hoje + timedelta(days=HORIZONTE_PREVISAO_DIAS) for data_hoje, _, _ in chaves]
+        return self._prever_datas(datas_previsao, [sku for _, sku, _ in chaves], [filial for _, _, filial in chaves])
+
+    def prever_demanda_horizonte(self, data_hoje, dias=3, skus=None, filiais=(FILIAL_GLOBAL,)):
+        """
+        Prevê a demanda de D+1 até D+`dias` para todos os SKUs e filiais pedidos, com uma
+        única matriz de features e um único predict.
+
+        Args:
+            data_hoje (datetime): Data base das previsões.
+            dias (int): Último horizonte (ex.: 3 para o ciclo de descongelamento).
+            skus (list, optional): SKUs a prever. Padrão: todos os SKUs conhecidos pelo modelo.
+            filiais (list, optional): Filiais a prever.
+
+        Returns:
+            pd.DataFrame: Colunas data_previsao, horizonte, filial, sku e previsao (kg).
+        """
+        if skus is None:
+            skus = [col[len('sku_'):] for col in self.colunas_features() if col.startswith('sku_')]
+        horizontes = np.arange(1, dias + 1)
+        grade = pd.MultiIndex.from_product(
+            [horizontes, [str(f) for f in filiais], [str(s) for s in skus]], names=['horizonte', 'filial', 'sku']
+        ).to_frame(index=False)
+        grade.insert(0, 'data_previsao', pd.Timestamp(data_hoje) + pd.to_timedelta(grade['horizonte'], unit='D'))
+        if grade.empty:
+            grade['previsao'] = []
+            return grade
+        pred = self._prever_datas(grade['data_previsao'], grade['sku'], grade['filial'])
+        grade['previsao'] = np.maximum(0, np.round(pred, 2))
+        return grade
+
+    def prever_demanda_lote(self, chaves):
+        """
+        Prevê a demanda de D+HORIZONTE_PREVISAO_DIAS para vários pares (filial, SKU) com um único predict.
+
+        Args:
+            chaves (list): Tuplas (data_hoje, sku, filial).
+
+        Returns:
+            list: Previsões em kg, na mesma ordem de `chaves`.
+        """
+        if not chaves:
+            return []
+        pred = self._prever_bruto(chaves)
+        return [max(0, round(float(p), 2)) for p in pred]
+
+    def prever_quantis_lote(self, chaves, quantis=QUANTIS_PREVISAO):
+        """
+        Faixas de previsão de D+HORIZONTE_PREVISAO_DIAS para vários pares (filial, SKU), a
+        partir da distribuição das previsões das árvores da floresta.
+
+        Args:
+            chaves (list): Tuplas (data_hoje, sku, filial).
+            quantis (tuple): Percentis desejados (ex.: (10, 50, 90) para P10/P50/P90).
+
+        Returns:
+            np.ndarray: Matriz (len(chaves), len(quantis)) em kg.
+        """
+        if not chaves:
+            return np.zeros((0, len(quantis)))
+        datas_previsao = pd.DatetimeIndex(
+            [data_hoje + timedelta(days=HORIZONTE_PREVISAO_DIAS) for data_hoje, _, _ in chaves]
+        )
+        skus = [str(sku) for _, sku, _ in chaves]
+        filiais = [str(filial) for _, _, filial in chaves]
+        X, n_registros = self._matriz_features(datas_previsao, skus, filiais)
+        bandas = self._aplicar_piso(self._quantis_matriz(X, skus, filiais, quantis), n_registros)
+        return np.maximum(0, np.round(bandas, 2))
+
+    def prever_demanda(self, data_hoje, sku, valor_real=None, filial=FILIAL_GLOBAL):
+        pred = float(self._prever_bruto([(data_hoje, sku, filial)])[0])
 
         # ✅ Mostrar as métricas se valor real for fornecido
         if valor_real is not None and valor_real > 0:
@@ -146,9 +1491,343 @@ class PrevisorDemanda:
             print(f"[{sku}] MAE: {mae:.2f} | RMSE: {rmse:.2f} | MAPE: {mape:.2f}%")
 
         return max(0, round(pred, 2))
-    
+
+    def folds_walk_forward(self, passo_dias=7, min_treino_dias=28, horizonte=HORIZONTE_PREVISAO_DIAS):
+        """
+        Monta os folds do backtest walk-forward sobre os dados carregados (após preparar_features).
+
+        Os cortes vão de `min_treino_dias` após a primeira venda até o fim do histórico, a cada
+        `passo_dias`. O fold de cada corte treina com as vendas até o corte (respeitando
+        `janela_treino_dias`) e prevê os dias alvo cuja previsão seria feita entre esse corte e o
+        seguinte, `horizonte` dias antes do alvo, com as médias móveis calculadas só com as vendas
+        conhecidas naquele dia. As matrizes de teste de todos os folds saem de uma única chamada
+        a `_matriz_features`.
+
+        Returns:
+            list: Um dicionário por fold, com corte, X_treino, y_treino, X_teste, y_teste,
+            n_registros e as colunas data, filial e sku das linhas de teste.
+        """
+        features = self.colunas_features()
+        dados = self._dados_para_treino(features)
+        datas = dados['data_dia'].to_numpy(dtype='datetime64[ns]')
+        horizonte = np.timedelta64(horizonte, 'D')
+        primeira, ultima = datas.min(), datas.max()
+        cortes = np.arange(
+            primeira + np.timedelta64(min_treino_dias, 'D'), ultima - horizonte + np.timedelta64(1, 'D'),
+            np.timedelta64(passo_dias, 'D'),
+        ).astype('datetime64[ns]')
+        if len(cortes) == 0:
+            return []
+
+        # Fold de cada linha alvo: último corte até o dia em que a previsão seria feita
+        fold_teste = np.searchsorted(cortes, datas - horizonte, side='right') - 1
+        teste = np.flatnonzero(fold_teste >= 0)
+        skus = self._rotulos_particao(dados.iloc[teste], 'sku')
+        filiais = self._rotulos_particao(dados.iloc[teste], 'filial')
+        X_teste, n_registros = self._matriz_features(
+            datas[teste], skus, filiais, datas_corte=datas[teste] - horizonte + np.timedelta64(1, 'D')
+        )
+        X = dados[features].to_numpy(dtype=float)
+        y = dados['total_venda_dia_kg'].to_numpy(dtype=float)
+
+        folds = []
+        for k, corte in enumerate(cortes):
+            treino = datas <= corte
+            if self.janela_treino_dias:
+                treino &= datas > corte - np.timedelta64(self.janela_treino_dias, 'D')
+            linhas = fold_teste[teste] == k
+            if not linhas.any():
+                continue
+            folds.append({
+                'corte': pd.Timestamp(corte),
+                'X_treino': X[treino],
+                'y_treino': y[treino],
+                'X_teste': X_teste[linhas],
+                'y_teste': y[teste[linhas]],
+                'n_registros': n_registros[linhas],
+                'data': datas[teste[linhas]],
+                'filial': filiais[linhas],
+                'sku': skus[linhas],
+            })
+        return folds
+
+    def backtest(self, passo_dias=7, min_treino_dias=28, horizonte=HORIZONTE_PREVISAO_DIAS,
+                 max_processos=None, folds=None):
+        """
+        Backtest walk-forward: re-treina o modelo em cada corte (ver folds_walk_forward), prevê
+        os alvos do fold em um único predict e compara com as vendas reais.
+
+        Os folds são treinados em paralelo em um pool de processos; use fora da interface
+        (ex.: `python main.py --backtest`).
+
+        Args:
+            passo_dias (int): Dias entre re-treinos.
+            min_treino_dias (int): Histórico mínimo antes do primeiro corte.
+            horizonte (int): Antecedência da previsão, em dias (D+2 por padrão).
+            max_processos (int, optional): Tamanho do pool. Padrão: todos os núcleos; 1 executa em série.
+            folds (list, optional): Folds já montados por folds_walk_forward.
+
+        Returns:
+            pd.DataFrame: Uma linha por previsão, com corte, data, filial, sku, real e previsao.
+        """
+        if folds is None:
+            folds = self.folds_walk_forward(passo_dias, min_treino_dias, horizonte)
+        colunas = ['corte', 'data', 'filial', 'sku', 'real', 'previsao']
+        if not folds:
+            return pd.DataFrame(columns=colunas)
+        features = self.colunas_features()
+        previsoes = _executar_folds(folds, features, self.hiperparametros, max_processos)
+
+        resultados = pd.concat([
+            pd.DataFrame({
+                'corte': fold['corte'],
+                'data': fold['data'],
+                'filial': fold['filial'],
+                'sku': fold['sku'],
+                'real': fold['y_teste'],
+                'previsao': np.maximum(0, np.round(self._aplicar_piso(pred, fold['n_registros']), 2)),
+            })
+            for fold, pred in zip(folds, previsoes)
+        ], ignore_index=True)
+        return resultados[colunas]
+
+    def _folds_em_cache(self, passo_dias, min_treino_dias, horizonte=HORIZONTE_PREVISAO_DIAS):
+        """
+        Diretório com os folds walk-forward salvos (ver salvar_folds), montados só na primeira
+        vez para os mesmos dados, features e parâmetros de corte.
+        """
+        chave = hashlib.sha256(json.dumps({
+            'dados': self.hash_dados,
+            'features': self.colunas_features(),
+            'janela_treino_dias': self.janela_treino_dias,
+            'passo_dias': passo_dias,
+            'min_treino_dias': min_treino_dias,
+            'horizonte': horizonte,
+        }, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        diretorio = os.path.join(self.script_dir, 'cache_folds', chave)
+        if not os.path.exists(os.path.join(diretorio, 'meta.json')):
+            salvar_folds(self.folds_walk_forward(passo_dias, min_treino_dias, horizonte), diretorio)
+        return diretorio
+
+    def buscar_hiperparametros(self, grade=None, mae_alvo=None, tolerancia=0.05, passo_dias=14,
+                               min_treino_dias=28, max_processos=None):
+        """
+        Avalia cada combinação de `grade` com validação cruzada temporal (folds walk-forward)
+        em um pool de processos e escolhe a mais barata que atinge a precisão desejada.
+
+        As matrizes dos folds são montadas uma única vez e ficam em cache_folds/, abertas com
+        memory mapping por todos os candidatos. O custo de cada candidato é o trabalho da
+        previsão pela FlorestaNumpy, que desce `profundidade` níveis em todas as árvores:
+        árvores x profundidade (média dos folds). É determinístico, ao contrário da latência
+        medida dentro do pool ocupado, que só é informada (latencia_ms).
+
+        Args:
+            grade (dict, optional): Valores por hiperparâmetro. Padrão: GRADE_HIPERPARAMETROS.
+            mae_alvo (float, optional): MAE máximo aceito. Padrão: o melhor MAE + `tolerancia`.
+            tolerancia (float): Folga relativa sobre o melhor MAE quando não há mae_alvo.
+            passo_dias (int): Dias entre os cortes dos folds.
+            min_treino_dias (int): Histórico mínimo antes do primeiro corte.
+            max_processos (int, optional): Tamanho do pool. Padrão: todos os núcleos.
+
+        Returns:
+            pd.DataFrame: Um candidato por linha (hiperparâmetros, mae, custo, latencia_ms, escolhido),
+            ordenado por MAE. O escolhido fica em self.hiperparametros e em hiperparametros.json.
+        """
+        grade = grade or GRADE_HIPERPARAMETROS
+        candidatos = [
+            {**dict(zip(grade, valores)), 'random_state': HIPERPARAMETROS['random_state']}
+            for valores in itertools.product(*grade.values())
+        ]
+        diretorio = self._folds_em_cache(passo_dias, min_treino_dias)
+        with open(os.path.join(diretorio, 'meta.json'), encoding='utf-8') as f:
+            n_folds = json.load(f)['n_folds']
+        if n_folds == 0:
+            raise ValueError("Histórico insuficiente para montar os folds da busca de hiperparâmetros.")
+        features = self.colunas_features()
+
+        tarefas = list(itertools.product(range(len(candidatos)), range(n_folds)))
+        max_processos = min(max_processos or os.cpu_count() or 1, len(tarefas))
+        n_jobs = max(1, (os.cpu_count() or 1) // max_processos)
+        with ProcessPoolExecutor(max_workers=max_processos) as pool:
+            futuros = [
+                pool.submit(_avaliar_candidato_fold, diretorio, k, features, candidatos[i], n_jobs)
+                for i, k in tarefas
+            ]
+            avaliacoes = np.array([futuro.result() for futuro in futuros]).reshape(len(candidatos), n_folds, 4)
+
+        resultados = pd.DataFrame(candidatos)
+        resultados['mae'] = avaliacoes[:, :, 0].sum(axis=1) / avaliacoes[:, :, 1].sum(axis=1)
+        resultados['custo'] = avaliacoes[:, :, 2].mean(axis=1)
+        resultados['latencia_ms'] = np.median(avaliacoes[:, :, 3], axis=1)
+        alvo = mae_alvo if mae_alvo is not None else resultados['mae'].min() * (1 + tolerancia)
+        aceitos = resultados[resultados['mae'] <= alvo]
+        if aceitos.empty:
+            print(f"Nenhum candidato atingiu MAE <= {alvo:.2f}; usando o de menor MAE.")
+            aceitos = resultados.nsmallest(1, 'mae')
+        # Empate de custo: menor MAE, e então a ordem da grade
+        escolhido = aceitos.sort_values(['custo', 'mae'], kind='stable').index[0]
+        resultados['escolhido'] = resultados.index == escolhido
+
+        self.hiperparametros = dict(candidatos[escolhido])
+        with open(caminho_hiperparametros(self.script_dir), 'w', encoding='utf-8') as f:
+            json.dump(self.hiperparametros, f, indent=4)
+        print(f"Hiperparâmetros escolhidos (MAE alvo {alvo:.2f}): {self.hiperparametros}")
+        return resultados.sort_values('mae').reset_index(drop=True)
+
+    @staticmethod
+    def metricas_backtest(resultados, por=('sku', 'filial')):
+        """
+        MAE, RMSE e MAPE (%) das previsões do backtest por grupo, com reduções vetorizadas.
+        O MAPE ignora os dias com venda real zero.
+
+        Returns:
+            pd.DataFrame: Índice pelas colunas de `por`; colunas mae, rmse, mape e n.
+        """
+        erro = resultados['previsao'] - resultados['real']
+        real = resultados['real']
+        termos = pd.DataFrame({
+            'mae': erro.abs(),
+            'rmse': erro ** 2,
+            'mape': (erro.abs() / real).where(real != 0) * 100,
+        })
+        grupos = termos.groupby([resultados[c] for c in por], observed=True)
+        metricas = grupos.mean()
+        metricas['rmse'] = np.sqrt(metricas['rmse'])
+        metricas['n'] = grupos.size()
+        return metricas
+
+# Prefixo das linhas de progresso impressas pelo processo de treino
+PREFIXO_PROGRESSO = '[progresso] '
+
+def reportar_progresso(etapa):
+    print(f"{PREFIXO_PROGRESSO}{etapa}", flush=True)
+
+class TreinamentoEmSegundoPlano:
+    """
+    Re-treina o modelo em um processo separado (`python main.py --dados ...`), sem bloquear
+    quem o iniciou. O chamador consulta `progresso()` periodicamente e, quando `concluido()`,
+    obtém com `resultado()` um novo PrevisorDemanda já carregado, pronto para substituir o atual.
+    Enquanto isso, o previsor atual continua servindo as previsões normalmente.
+    """
+    def __init__(self, script_dir, caminho_dados, hiperparametros=None, incremental=False, particao=None):
+        self.script_dir = script_dir
+        self.caminho_dados = caminho_dados
+        self.hiperparametros = dict(hiperparametros or carregar_hiperparametros(script_dir))
+        self.incremental = incremental
+        # Com modelos particionados em uso, eles são re-treinados junto com o global; senão
+        # continuariam tendo precedência com o modelo antigo
+        if particao is None and os.path.exists(caminho_registro_particoes(script_dir)):
+            with open(caminho_registro_particoes(script_dir), encoding='utf-8') as f:
+                particao = json.load(f).get('particao')
+        self.particao = particao
+        self._mensagens = queue.Queue()
+        self._concluido = threading.Event()
+        self._resultado = None
+        self._erro = None
+        threading.Thread(target=self._executar, daemon=True).start()
+
+    def _executar(self):
+        try:
+            comando = [
+                sys.executable, os.path.abspath(__file__),
+                '--dados', self.caminho_dados,
+                '--script-dir', self.script_dir,
+                '--hiperparametros', json.dumps(self.hiperparametros),
+            ] + (['--incremental'] if self.incremental else []) + (
+                ['--particionado', self.particao] if self.particao else []
+            )
+            processo = subprocess.Popen(
+                comando, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                encoding='utf-8', errors='replace', env={**os.environ, 'PYTHONIOENCODING': 'utf-8'}
+            )
+            saida = []
+            for linha in processo.stdout:
+                linha = linha.rstrip()
+                saida.append(linha)
+                if linha.startswith(PREFIXO_PROGRESSO):
+                    self._mensagens.put(linha[len(PREFIXO_PROGRESSO):])
+            if processo.wait() != 0:
+                raise RuntimeError("Falha no processo de treino:\n" + "\n".join(saida[-10:]))
+
+            self._mensagens.put("Carregando o novo modelo...")
+            novo = PrevisorDemanda(self.script_dir)
+            novo.hiperparametros = self.hiperparametros
+            novo.carregar_dados_vendas(self.caminho_dados)
+            novo.preparar_features()
+            novo.carregar_modelo()
+            if os.path.exists(novo.caminho_registro_particoes()):
+                try:
+                    novo.carregar_modelos_particionados()
+                except ValueError as e:
+                    self._mensagens.put(f"Modelos particionados não carregados: {e}")
+            self._resultado = novo
+        except Exception as e:
+            self._erro = e
+        finally:
+            self._concluido.set()
+
+    def progresso(self):
+        """Retorna as mensagens de progresso recebidas desde a última consulta."""
+        mensagens = []
+        while True:
+            try:
+                mensagens.append(self._mensagens.get_nowait())
+            except queue.Empty:
+                return mensagens
+
+    def concluido(self):
+        return self._concluido.is_set()
+
+    def resultado(self):
+        if self._erro is not None:
+            raise self._erro
+        return self._resultado
+
 if __name__ == "__main__":
-    previsor = PrevisorDemanda(script_dir='.')
-    previsor.carregar_dados_vendas('dados_vendas.csv')
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Treina o modelo de previsão de demanda.")
+    parser.add_argument('--dados', default='dados_vendas.csv', help="CSV de vendas diárias")
+    parser.add_argument('--script-dir', default='.', help="Diretório onde o modelo é salvo")
+    parser.add_argument('--hiperparametros', default=None, help="JSON com hiperparâmetros do RandomForest")
+    parser.add_argument('--janela-dias', type=int, default=JANELA_TREINO_DIAS,
+                        help="Dias de histórico por filial/SKU usados no treino (0 = todo o histórico)")
+    parser.add_argument('--incremental', action='store_true', help="Acrescenta árvores treinadas só com as vendas novas")
+    parser.add_argument('--particionado', choices=PARTICOES_MODELO, default=None,
+                        help="Depois do modelo global, treina um modelo por filial ou por SKU, em paralelo")
+    parser.add_argument('--backtest', action='store_true',
+                        help="Avalia o modelo em walk-forward (re-treino a cada --passo-dias) em vez de treinar")
+    parser.add_argument('--passo-dias', type=int, default=7, help="Dias entre os cortes do backtest")
+    parser.add_argument('--buscar-hiperparametros', action='store_true',
+                        help="Escolhe os hiperparâmetros por validação cruzada temporal antes de treinar")
+    parser.add_argument('--mae-alvo', type=float, default=None, help="MAE máximo aceito na busca de hiperparâmetros")
+    args = parser.parse_args()
+
+    previsor = PrevisorDemanda(script_dir=args.script_dir, janela_treino_dias=args.janela_dias or None)
+    if args.hiperparametros:
+        previsor.hiperparametros.update(json.loads(args.hiperparametros))
+    reportar_progresso("Carregando dados de vendas...")
+    previsor.carregar_dados_vendas(args.dados)
+    reportar_progresso("Preparando features...")
     previsor.preparar_features()
-    previsor.treinar_modelo()  # Aqui está o print das métricas!
+    if args.backtest:
+        reportar_progresso("Executando backtest walk-forward...")
+        resultados = previsor.backtest(passo_dias=args.passo_dias)
+        print(previsor.metricas_backtest(resultados).round(2).to_string())
+        print(previsor.metricas_backtest(resultados.assign(todos='*'), por=('todos',)).round(2).to_string())
+        sys.exit(0)
+    if args.buscar_hiperparametros:
+        reportar_progresso("Buscando hiperparâmetros...")
+        resultados = previsor.buscar_hiperparametros(mae_alvo=args.mae_alvo)
+        print(resultados.round(3).to_string())
+    if args.incremental:
+        reportar_progresso("Treinando modelo (incremental)...")
+        previsor.treinar_incremental()
+    else:
+        reportar_progresso("Treinando modelo...")
+        previsor.treinar_modelo()  # Aqui está o print das métricas!
+    if args.particionado:
+        # O modelo global continua sendo o de reserva das linhas sem partição própria
+        reportar_progresso(f"Treinando modelos por {args.particionado}...")
+        previsor.treinar_particionado(args.particionado)
+    reportar_progresso("Treino concluído.")
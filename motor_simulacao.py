@@ -0,0 +1,792 @@
+"""
+Motor da simulação de descongelamento, sem interface gráfica.
+
+O MotorSimulacao guarda o relógio simulado (dia e hora), os processos gerados e os
+contadores por filial/SKU, e aplica as regras de geração diária, liberação das etapas às
+06:00, movimentação, abastecimento do balcão, compras e fim de expediente. Avisos ao
+usuário e registros de log saem por callbacks: o Frango_app os liga a messagebox e ao CSV
+de log, enquanto simulações em lote (ou testes) rodam sem display.
+
+Uso em lote:
+    motor = MotorSimulacao(filiais=[str(f) for f in range(50)])
+    motor.iniciar()
+    motor.executar_ate(365, a_cada_hora=lambda m: m.concluir_etapas_aguardando("lote"))
+
+Cada processo é um Processo compacto (__slots__): status em códigos inteiros, o status das
+etapas num bytearray indexado pelo dia do ciclo e uma referência à definição do SKU, em vez
+de cópias das descrições das etapas.
+
+Com um ArquivoProcessos, os processos concluídos há mais de `dias_retencao` dias saem da
+memória para o arquivo em disco a cada virada de dia, e continuam disponíveis em
+`consultar` e `consultar_processo`.
+"""
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import json
+import os
+
+# --- Definição de SKUs com suas lógicas e rótulos de coluna ---
+SKU_DEFINITIONS = {
+    "237478": { # FILE DE PEITO FGO INTERF CONG KG
+        "days_cycle": 3,
+        "display_column_label": "FILE DE PEITO FGO",
+        "steps_descriptions": {
+            0: "237478 Peito de Frango: Retirado do congelador para estante de descongelamento inicial.",
+            1: "237478 Peito de Frango: Movido para estante intermediária de descongelamento.",
+            2: "237478 Peito de Frango: Pronto para embalagem/exposição."
+        }
+    },
+    "237479": { # ASA DE FGO INTERF CONG KG
+        "days_cycle": 3,
+        "display_column_label": "ASA DE FGO",
+        "steps_descriptions": {
+            0: "237479 Asa de Frango: Retirada do congelador para estante 1 do armazém.",
+            1: "237479 Asa de Frango: Movida para estante de descongelamento esquerda para a central.",
+            2: "237479 Asa de Frango: Movida para estante central para a direita (pronta para exposição)."
+        }
+    },
+    "237496": { # CORACAO DE FGO INTERF CONG KG
+        "days_cycle": 3,
+        "display_column_label": "CORACAO DE FGO",
+        "steps_descriptions": {
+            0: "237496 Coração de Frango: Retirado do congelador para estante de descongelamento inicial.",
+            1: "237496 Coração de Frango: Movido para estante intermediária de descongelamento.",
+            2: "237496 Coração de Frango: Pronto para embalagem/exposição."
+        }
+    },
+    "237497": { # COXA C/SOB FGO INTERF CONG KG
+        "days_cycle": 3,
+        "display_column_label": "COXA C/SOB FGO",
+        "steps_descriptions": {
+            0: "237497 Coxa c/ Sobrecoxa: Retirada do congelador e movida para área inicial de descongelamento.",
+            1: "237497 Coxa c/ Sobrecoxa: Movida para área intermediária de descongelamento.",
+            2: "237497 Coxa c/ Sobrecoxa: Movida para área final, pronto para exposição."
+        }
+    },
+    "237506": { # COXA DE FGO INTERF CONG KG
+        "days_cycle": 3,
+        "display_column_label": "COXA DE FGO",
+        "steps_descriptions": {
+            0: "237506 Coxa de Frango: Retirada do congelador e movida para área inicial de descongelamento.",
+            1: "237506 Coxa de Frango: Movida para área intermediária de descongelamento.",
+            2: "237506 Coxa de Frango: Movido para área final, pronto para exposição."
+        }
+    },
+    "237508": { # COXINHA DA ASA FGO INTERF CONG KG
+        "days_cycle": 3,
+        "display_column_label": "COXINHA DA ASA FGO",
+        "steps_descriptions": {
+            0: "237508 Coxinha da Asa: Retirada do congelador para estante de descongelamento inicial.",
+            1: "237508 Coxinha da Asa: Movida para estante intermediária de descongelamento.",
+            2: "237508 Coxinha da Asa: Pronto para embalagem/exposição."
+        }
+    },
+    "237511": { # MOELA DE FRANGO INTERF CONG KG
+        "days_cycle": 3,
+        "display_column_label": "MOELA DE FRANGO",
+        "steps_descriptions": {
+            0: "237511 Moela de Frango: Retirada do congelador para estante de descongelamento inicial.",
+            1: "237511 Moela de Frango: Movido para estante intermediária de descongelamento.",
+            2: "237511 Moela de Frango: Pronto para embalagem/exposição."
+        }
+    },
+    "384706": { # PE FRANGO INTERF CONG KG
+        "days_cycle": 3,
+        "display_column_label": "PE FRANGO",
+        "steps_descriptions": {
+            0: "384706 Pé de Frango: Retirado do congelador para estante de descongelamento inicial.",
+            1: "384706 Pé de Frango: Movido para estante intermediária de descongelamento.",
+            2: "384706 Pé de Frango: Pronto para embalagem/exposição."
+        }
+    }
+}
+KNOWN_FILIAIS = ["7", "8", "9", "10"]
+
+# Hora em que as etapas do dia passam de "Desabilitado" para "Aguardando"
+HORA_LIBERACAO_ETAPAS = 6
+# Hora a partir da qual roda a rotina de fim de expediente
+HORA_FIM_EXPEDIENTE = 18
+# Quantidade (kg) de cada processo quando o motor não recebe uma função de previsão
+QUANTIDADE_PADRAO_KG = 100.0
+
+# Dias que um processo concluído fica em memória antes de ir para o ArquivoProcessos
+DIAS_RETENCAO_PROCESSOS = 7
+
+# Status de um processo (o status de cada etapa fica em Processo.status_etapas)
+STATUS_EM_ANDAMENTO = 0
+STATUS_CONCLUIDO = 1
+NOMES_STATUS_PROCESSO = ("Em andamento", "Concluído")
+
+# Status de uma etapa, indexados por NOMES_STATUS_ETAPA para exibição
+ETAPA_DESABILITADA = 0
+ETAPA_AGUARDANDO = 1
+ETAPA_FEITA = 2
+NOMES_STATUS_ETAPA = ("Desabilitado", "Aguardando", "Feito")
+
+
+def _ignorar(*args, **kwargs):
+    pass
+
+
+class Movimentacao:
+    """Movimentação de uma etapa: quem iniciou, quando, e quando foi confirmada."""
+    __slots__ = ('responsavel', 'inicio_ts', 'confirmacao_ts', 'dia_conclusao', 'hora_conclusao')
+
+    def __init__(self, responsavel, inicio_ts, confirmacao_ts=None, dia_conclusao=None, hora_conclusao=None):
+        self.responsavel = responsavel
+        self.inicio_ts = inicio_ts
+        self.confirmacao_ts = confirmacao_ts
+        self.dia_conclusao = dia_conclusao
+        self.hora_conclusao = hora_conclusao
+
+    @property
+    def data_movimentacao(self):
+        if self.dia_conclusao is None:
+            return None
+        return f"Dia {self.dia_conclusao} - Hora {self.hora_conclusao:02d}:00"
+
+    def para_lista(self):
+        return [
+            self.responsavel,
+            self.inicio_ts.isoformat(),
+            self.confirmacao_ts.isoformat() if self.confirmacao_ts else None,
+            self.dia_conclusao,
+            self.hora_conclusao,
+        ]
+
+    @classmethod
+    def de_lista(cls, valores):
+        responsavel, inicio_ts, confirmacao_ts, dia_conclusao, hora_conclusao = valores
+        return cls(
+            responsavel,
+            datetime.fromisoformat(inicio_ts),
+            datetime.fromisoformat(confirmacao_ts) if confirmacao_ts else None,
+            dia_conclusao,
+            hora_conclusao,
+        )
+
+
+class Processo:
+    """
+    Processo de descongelamento de um SKU numa filial.
+
+    `definicao` é o próprio dicionário do SKU em SKU_DEFINITIONS (compartilhado por todos os
+    processos do SKU). O status de cada etapa fica em `status_etapas` (ETAPA_*), indexado
+    pelo dia do ciclo; `movimentacoes` e `replenishment_log` só são criados quando a primeira
+    movimentação ou o primeiro abastecimento acontecem.
+    """
+    __slots__ = (
+        'numero', 'sku_process_number', 'dia_geracao', 'hora_criacao', 'sku', 'definicao', 'filial',
+        'quantidade_inicial_kg', 'quantidade_kg', 'peso_no_balcao', 'status', 'dia_conclusao',
+        'status_etapas', 'movimentacoes', 'replenishment_log',
+    )
+    # Campos gravados como estão por para_registro
+    CAMPOS_SIMPLES = (
+        'numero', 'sku_process_number', 'dia_geracao', 'hora_criacao', 'sku', 'filial',
+        'quantidade_inicial_kg', 'quantidade_kg', 'peso_no_balcao', 'status', 'dia_conclusao',
+    )
+
+    def __init__(self, numero, sku_process_number, dia_geracao, hora_criacao, sku, definicao, filial, quantidade_kg):
+        self.numero = numero
+        self.sku_process_number = sku_process_number
+        self.dia_geracao = dia_geracao
+        self.hora_criacao = hora_criacao
+        self.sku = sku
+        self.definicao = definicao
+        self.filial = filial
+        self.quantidade_inicial_kg = quantidade_kg
+        self.quantidade_kg = quantidade_kg
+        self.peso_no_balcao = 0.0
+        self.status = STATUS_EM_ANDAMENTO
+        self.dia_conclusao = None
+        self.status_etapas = bytearray(definicao["days_cycle"])
+        self.movimentacoes = None
+        self.replenishment_log = None
+
+    def __repr__(self):
+        return f"Processo({self.sku_process_number!r}, {NOMES_STATUS_PROCESSO[self.status]})"
+
+    @property
+    def days_cycle(self):
+        return len(self.status_etapas)
+
+    @property
+    def steps_descriptions(self):
+        return self.definicao.get("steps_descriptions", {})
+
+    def day_offset(self, dia_etapa):
+        """Dia do ciclo da etapa do dia absoluto `dia_etapa`, ou None se o processo não tiver essa etapa."""
+        day_offset = dia_etapa - self.dia_geracao
+        return day_offset if 0 <= day_offset < len(self.status_etapas) else None
+
+    def movimentacao(self, day_offset):
+        """Movimentação da etapa `day_offset`, ou None se ela ainda não foi iniciada."""
+        return self.movimentacoes[day_offset] if self.movimentacoes is not None else None
+
+    def iniciar_movimentacao(self, day_offset, responsavel, inicio_ts):
+        if self.movimentacoes is None:
+            self.movimentacoes = [None] * len(self.status_etapas)
+        movimentacao = self.movimentacoes[day_offset] = Movimentacao(responsavel, inicio_ts)
+        return movimentacao
+
+    def registrar_abastecimento(self, usuario, timestamp, quantidade_kg):
+        if self.replenishment_log is None:
+            self.replenishment_log = []
+        self.replenishment_log.append({
+            "usuario": usuario,
+            "timestamp": timestamp,
+            "quantidade_abastecida": quantidade_kg
+        })
+
+    def para_registro(self):
+        """Dicionário serializável em JSON (sem a definição do SKU, que volta em de_registro)."""
+        registro = {campo: getattr(self, campo) for campo in self.CAMPOS_SIMPLES}
+        registro['status_etapas'] = list(self.status_etapas)
+        registro['movimentacoes'] = (
+            [m.para_lista() if m else None for m in self.movimentacoes] if self.movimentacoes is not None else None
+        )
+        registro['replenishment_log'] = [
+            {**log, 'timestamp': log['timestamp'].isoformat()} for log in self.replenishment_log or ()
+        ]
+        return registro
+
+    @classmethod
+    def de_registro(cls, registro, definicao):
+        processo = cls.__new__(cls)
+        for campo in cls.CAMPOS_SIMPLES:
+            setattr(processo, campo, registro[campo])
+        processo.definicao = definicao
+        processo.status_etapas = bytearray(registro['status_etapas'])
+        processo.movimentacoes = (
+            [Movimentacao.de_lista(m) if m else None for m in registro['movimentacoes']]
+            if registro['movimentacoes'] is not None else None
+        )
+        processo.replenishment_log = [
+            {**log, 'timestamp': datetime.fromisoformat(log['timestamp'])} for log in registro['replenishment_log']
+        ] or None
+        return processo
+
+
+class RegistroProcessos:
+    """
+    Processos por id (sku_process_number), em ordem de geração, com índices secundários por
+    filial, sku, status, dia de geração e dia de conclusão. Cada índice mapeia valor ->
+    {id: processo}, de modo que as consultas percorrem só o menor grupo dos critérios, e
+    não o total de processos já gerados.
+    """
+    CAMPOS_INDEXADOS = ('filial', 'sku', 'status', 'dia_geracao', 'dia_conclusao')
+
+    def __init__(self):
+        self._por_id = {}
+        self._indices = {campo: {} for campo in self.CAMPOS_INDEXADOS}
+
+    def __len__(self):
+        return len(self._por_id)
+
+    def __iter__(self):
+        return iter(self._por_id.values())
+
+    def __contains__(self, process_id):
+        return process_id in self._por_id
+
+    def obter(self, process_id):
+        return self._por_id.get(process_id)
+
+    def valores(self, campo):
+        """Valores distintos presentes no índice de `campo`."""
+        return list(self._indices[campo])
+
+    def _indexar(self, campo, valor, process_id, processo):
+        self._indices[campo].setdefault(valor, {})[process_id] = processo
+
+    def _desindexar(self, campo, valor, process_id):
+        grupo = self._indices[campo][valor]
+        del grupo[process_id]
+        if not grupo:
+            del self._indices[campo][valor]
+
+    def adicionar(self, processo):
+        process_id = processo.sku_process_number
+        self._por_id[process_id] = processo
+        for campo in self.CAMPOS_INDEXADOS:
+            self._indexar(campo, getattr(processo, campo), process_id, processo)
+
+    def remover(self, process_id):
+        processo = self._por_id.pop(process_id)
+        for campo in self.CAMPOS_INDEXADOS:
+            self._desindexar(campo, getattr(processo, campo), process_id)
+        return processo
+
+    def atualizar(self, processo, **campos):
+        """Altera campos indexados de um processo, mantendo os índices em dia."""
+        process_id = processo.sku_process_number
+        for campo, valor in campos.items():
+            self._desindexar(campo, getattr(processo, campo), process_id)
+            setattr(processo, campo, valor)
+            self._indexar(campo, valor, process_id, processo)
+
+    def filtrar(self, **criterios):
+        """
+        Processos cujos campos indexados são iguais a todos os `criterios`
+        (ex.: filtrar(filial="7", status=STATUS_EM_ANDAMENTO)).
+
+        Percorre o menor dos grupos dos critérios e testa cada id nos demais: o custo é o
+        tamanho desse grupo vezes o número de critérios, que pode ser maior que o resultado.
+        """
+        if not criterios:
+            return list(self)
+        grupos = [self._indices[campo].get(valor, {}) for campo, valor in criterios.items()]
+        menor = min(grupos, key=len)
+        return [processo for process_id, processo in menor.items() if all(process_id in g for g in grupos)]
+
+
+class ArquivoProcessos:
+    """
+    Arquivo em disco (JSON Lines, só de acréscimo) dos processos concluídos que a política de
+    retenção tirou da memória. Continua consultável: por id, com um índice de posições no
+    arquivo montado na primeira consulta, e por campos, lendo o arquivo em sequência.
+
+    Cada linha é um Processo.para_registro(); a definição do SKU volta, na leitura, de `skus`.
+    """
+    def __init__(self, caminho, skus=None):
+        self.caminho = caminho
+        self.skus = SKU_DEFINITIONS if skus is None else skus
+        self._posicoes = None
+
+    def limpar(self):
+        """Começa um arquivo vazio (os ids dos processos recomeçam a cada simulação)."""
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        open(self.caminho, 'wb').close()
+        self._posicoes = {}
+
+    @staticmethod
+    def _serializar(processo):
+        return (json.dumps(processo.para_registro(), ensure_ascii=False) + '\n').encode('utf-8')
+
+    def _restaurar(self, registro):
+        return Processo.de_registro(registro, self.skus.get(registro['sku'], {}))
+
+    def arquivar(self, processos):
+        with open(self.caminho, 'ab') as f:
+            for processo in processos:
+                posicao = f.tell()
+                f.write(self._serializar(processo))
+                if self._posicoes is not None:
+                    self._posicoes[processo.sku_process_number] = posicao
+
+    def _linhas(self):
+        """(posição, linha) de cada processo arquivado."""
+        if not os.path.exists(self.caminho):
+            return
+        with open(self.caminho, 'rb') as f:
+            posicao = 0
+            for linha in f:
+                yield posicao, linha
+                posicao += len(linha)
+
+    def obter(self, process_id):
+        if self._posicoes is None:
+            self._posicoes = {json.loads(linha)['sku_process_number']: posicao for posicao, linha in self._linhas()}
+        posicao = self._posicoes.get(process_id)
+        if posicao is None:
+            return None
+        with open(self.caminho, 'rb') as f:
+            f.seek(posicao)
+            return self._restaurar(json.loads(f.readline()))
+
+    def filtrar(self, **criterios):
+        """Processos arquivados cujos campos são iguais a todos os `criterios`, em ordem de arquivamento."""
+        for _, linha in self._linhas():
+            registro = json.loads(linha)
+            if all(registro.get(campo) == valor for campo, valor in criterios.items()):
+                yield self._restaurar(registro)
+
+
+class MotorSimulacao:
+    """
+    Estado e regras da simulação: relógio, processos (RegistroProcessos), contadores e
+    processos prontos para o abastecedor, por filial.
+
+    Args:
+        skus (dict): Definições dos SKUs (padrão: SKU_DEFINITIONS).
+        filiais (list): Filiais simuladas (padrão: KNOWN_FILIAIS).
+        data_inicio (datetime): Data do dia 0 (padrão: hoje, à meia-noite).
+        quantidades (callable): Recebe as chaves (data_base, sku, filial) do dia e retorna a
+            quantidade a descongelar de cada uma (padrão: QUANTIDADE_PADRAO_KG).
+        registrar_evento (callable): Mesma assinatura de Frango_app.log_event.
+        ao_mensagem (callable): Recebe as mensagens de acompanhamento (ex.: print).
+        ao_registrar_sobra (callable): (filial, processo, sobra_estante, sobra_balcao), no fim
+            de expediente, para cada processo com sobra.
+        ao_encerrar_processo (callable): (process_id), para cada processo retirado da tela
+            do abastecedor no fim de expediente.
+        ao_fim_de_expediente (callable): (houve_sobras), ao final da rotina.
+        arquivo (ArquivoProcessos): Destino dos processos concluídos antigos; sem ele, todos
+            os processos ficam em memória.
+        dias_retencao (int): Dias que um processo concluído fica em memória antes de ser arquivado.
+    """
+    def __init__(self, skus=None, filiais=None, data_inicio=None, quantidades=None,
+                 registrar_evento=None, ao_mensagem=None, ao_registrar_sobra=None,
+                 ao_encerrar_processo=None, ao_fim_de_expediente=None, arquivo=None,
+                 dias_retencao=DIAS_RETENCAO_PROCESSOS):
+        self.skus = SKU_DEFINITIONS if skus is None else skus
+        self.filiais = list(KNOWN_FILIAIS if filiais is None else filiais)
+        if data_inicio is None:
+            data_inicio = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.data_inicio = data_inicio
+        self.quantidades = quantidades or (lambda chaves: [QUANTIDADE_PADRAO_KG] * len(chaves))
+        self.registrar_evento = registrar_evento or _ignorar
+        self.ao_mensagem = ao_mensagem or _ignorar
+        self.ao_registrar_sobra = ao_registrar_sobra or _ignorar
+        self.ao_encerrar_processo = ao_encerrar_processo or _ignorar
+        self.ao_fim_de_expediente = ao_fim_de_expediente or _ignorar
+        self.arquivo = arquivo
+        self.dias_retencao = dias_retencao
+
+        self.dia_atual = 0
+        self.hora_atual = 0
+        self.limpeza_feita_no_dia = -1
+        self.processos = RegistroProcessos()
+        # Agenda das liberações de etapas: heap de (instante, ordem, processo, day_offset), com
+        # o instante em horas desde o dia 0. Cada etapa só entra na agenda quando pode ser
+        # liberada: a do dia 0 ao gerar o processo, as demais ao confirmar a etapa anterior.
+        self._agenda = []
+        self._ordem = itertools.count()
+        # Etapas em "Aguardando": (process_id, dia_etapa) -> processo
+        self.etapas_aguardando = {}
+        # Contadores aninhados: contadores[filial][sku]
+        self.contadores = {filial: {sku: 0 for sku in self.skus} for filial in self.filiais}
+        # Processos com o último dia concluído, exibidos ao abastecedor até o fim do expediente
+        self.concluidos_por_filial = {filial: [] for filial in self.filiais}
+
+    def data_simulada(self):
+        """Datetime simulado atual: data de início + dia e hora da simulação."""
+        return self.data_inicio + timedelta(days=self.dia_atual, hours=self.hora_atual)
+
+    def processo(self, process_id):
+        return self.processos.obter(process_id)
+
+    def consultar_processo(self, process_id):
+        """Processo em memória ou, se já arquivado, lido do arquivo (para relatórios)."""
+        processo = self.processos.obter(process_id)
+        if processo is None and self.arquivo is not None:
+            processo = self.arquivo.obter(process_id)
+        return processo
+
+    def consultar(self, **criterios):
+        """Processos arquivados e em memória que atendem aos `criterios` (para relatórios)."""
+        arquivados = list(self.arquivo.filtrar(**criterios)) if self.arquivo is not None else []
+        return arquivados + self.processos.filtrar(**criterios)
+
+    def arquivar_concluidos(self):
+        """
+        Move para o arquivo os processos concluídos há mais de `dias_retencao` dias (exceto os
+        que ainda aguardam a rotina de fim de expediente na tela do abastecedor).
+        """
+        if self.arquivo is None or self.dias_retencao is None:
+            return 0
+        limite = self.dia_atual - self.dias_retencao
+        em_tela = {pid for ids in self.concluidos_por_filial.values() for pid in ids}
+        antigos = [
+            processo
+            for dia in self.processos.valores('dia_conclusao') if dia is not None and dia < limite
+            for processo in self.processos.filtrar(dia_conclusao=dia)
+            if processo.sku_process_number not in em_tela
+        ]
+        if antigos:
+            self.arquivo.arquivar(antigos)
+            for processo in antigos:
+                self.processos.remover(processo.sku_process_number)
+            self.ao_mensagem(f"{len(antigos)} processos concluídos até o Dia {limite - 1} movidos para o arquivo.")
+        return len(antigos)
+
+    # --- Geração e estados ---
+
+    def gerar_processo(self, sku, quantidade_kg, filial_processo):
+        if sku not in self.skus:
+            self.ao_mensagem(f"Erro: SKU '{sku}' não encontrado nas definições. Pulando a geração do processo.")
+            return None
+
+        contadores_filial = self.contadores.setdefault(filial_processo, {})
+        contadores_filial[sku] = contadores_filial.get(sku, 0) + 1
+        numero = f"{contadores_filial[sku]}-{filial_processo}"
+        sku_process_number = f"{sku}-{numero}"
+
+        novo_processo = Processo(
+            numero, sku_process_number, self.dia_atual, self.hora_atual, sku, self.skus[sku], filial_processo, quantidade_kg
+        )
+        self.processos.adicionar(novo_processo)
+        self._agendar(novo_processo, 0)
+        self.ao_mensagem(f"Processo {sku_process_number} (Dia {self.dia_atual} - Hora {self.hora_atual:02d}:00, SKU {sku}, Qty {quantidade_kg} kg) gerado com sucesso! Todos os passos iniciais: Desabilitado")
+
+        self.registrar_evento(
+            evento="PROCESSO CRIADO",
+            filial=filial_processo,
+            sku=sku,
+            process_id=sku_process_number,
+            dia_processo="N/A",
+            quantidade_kg=quantidade_kg,
+            usuario="SISTEMA"
+        )
+        return novo_processo
+
+    def gerar_processos_do_dia(self):
+        self.ao_mensagem(f"\n--- Gerando processos para o Dia {self.dia_atual} (00:00) ---")
+        data_base = self.data_simulada()
+        chaves = [(data_base, sku, filial) for filial in self.filiais for sku in self.skus]
+        for (_, sku, filial), quantidade in zip(chaves, self.quantidades(chaves)):
+            self.gerar_processo(sku, quantidade, filial)
+        self.ao_mensagem(f"--- Geração de processos diária concluída para o Dia {self.dia_atual} ---")
+
+    def reprever_quantidades(self, dia=None):
+        """
+        Recalcula com `quantidades` a quantidade dos processos gerados em `dia` (padrão: o dia
+        atual) cuja movimentação ainda não começou; ex.: processos gerados com previsões
+        provisórias enquanto o modelo de demanda carregava. Cada processo recalculado gera um
+        evento "QUANTIDADE RECALCULADA", que corrige a quantidade do "PROCESSO CRIADO" no log.
+
+        Returns:
+            list: Processos atualizados.
+        """
+        dia = self.dia_atual if dia is None else dia
+        processos = [p for p in self.processos.filtrar(dia_geracao=dia) if p.movimentacoes is None]
+        data_base = self.data_inicio + timedelta(days=dia)
+        chaves = [(data_base, processo.sku, processo.filial) for processo in processos]
+        for processo, quantidade in zip(processos, self.quantidades(chaves)):
+            anterior = processo.quantidade_kg
+            processo.quantidade_inicial_kg = processo.quantidade_kg = quantidade
+            self.registrar_evento(
+                evento="QUANTIDADE RECALCULADA",
+                filial=processo.filial,
+                sku=processo.sku,
+                process_id=processo.sku_process_number,
+                dia_processo="N/A",
+                quantidade_kg=quantidade,
+                usuario="SISTEMA",
+                info_adicional=f"Quantidade provisória de {anterior}kg substituída pela previsão do modelo."
+            )
+        if processos:
+            self.ao_mensagem(f"Quantidades de {len(processos)} processos do Dia {dia} recalculadas.")
+        return processos
+
+    def iniciar(self):
+        """Gera os processos do dia inicial e libera as etapas que já estiverem no horário."""
+        if self.arquivo is not None:
+            self.arquivo.limpar()
+        self.gerar_processos_do_dia()
+        self.atualizar_estados()
+
+    def instante_atual(self):
+        """Horas simuladas desde as 00:00 do dia 0 (chave da agenda de liberações)."""
+        return self.dia_atual * 24 + self.hora_atual
+
+    def _agendar(self, processo, day_offset):
+        """Agenda a liberação da etapa `day_offset` para as 06:00 do seu dia."""
+        instante = (processo.dia_geracao + day_offset) * 24 + HORA_LIBERACAO_ETAPAS
+        heapq.heappush(self._agenda, (instante, next(self._ordem), processo, day_offset))
+
+    def _liberar(self, processo, day_offset):
+        dia_etapa = processo.dia_geracao + day_offset
+        if processo.status_etapas[day_offset] != ETAPA_DESABILITADA:
+            return
+        processo.status_etapas[day_offset] = ETAPA_AGUARDANDO
+        self.etapas_aguardando[(processo.sku_process_number, dia_etapa)] = processo
+        self.ao_mensagem(f"Processo {processo.sku_process_number} - Etapa Dia {day_offset} (Absoluto {dia_etapa}) ATIVADA para AGUARDANDO no Dia {self.dia_atual} Hora {self.hora_atual:02d}:00.")
+
+    def atualizar_estados(self):
+        """Libera as etapas agendadas até o instante atual; o custo é proporcional a elas."""
+        self.ao_mensagem(f"\n--- Verificando e atualizando estados dos processos (Dia {self.dia_atual} Hora {self.hora_atual:02d}:00) ---")
+        agora = self.instante_atual()
+        while self._agenda and self._agenda[0][0] <= agora:
+            _, _, processo, day_offset = heapq.heappop(self._agenda)
+            self._liberar(processo, day_offset)
+        self.ao_mensagem("--- Verificação e atualização de estados concluída ---")
+
+    # --- Relógio ---
+
+    def rotina_fim_de_expediente(self):
+        """Rotina de fim de expediente: registra sobras e retira os processos prontos da tela do abastecedor."""
+        self.ao_mensagem(f"--- Iniciando Rotina de Fim de Expediente (Dia {self.dia_atual}) ---")
+        houve_sobras = False
+        for filial, process_ids in list(self.concluidos_por_filial.items()):
+            removidos = []
+            for process_id in process_ids:
+                processo = self.processo(process_id)
+                if not processo:
+                    continue
+                sobra_estante = processo.quantidade_kg
+                sobra_balcao = processo.peso_no_balcao
+                if sobra_estante + sobra_balcao > 0:
+                    houve_sobras = True
+                    self.ao_registrar_sobra(filial, processo, sobra_estante, sobra_balcao)
+                    self.ao_mensagem(f"Filial {filial}: Registrado sobra de {sobra_estante + sobra_balcao:.2f} kg para o processo {process_id}.")
+                self.ao_encerrar_processo(process_id)
+                removidos.append(process_id)
+
+            self.concluidos_por_filial[filial] = [pid for pid in process_ids if pid not in removidos]
+            self.ao_mensagem(f"Filial {filial}: Removidos {len(removidos)} processos da tela de abastecimento.")
+
+        self.limpeza_feita_no_dia = self.dia_atual
+        self.ao_fim_de_expediente(houve_sobras)
+        self.ao_mensagem("--- Rotina de Fim de Expediente Concluída ---")
+
+    def verificar_eventos_de_horario(self):
+        """Dispara a rotina de fim de expediente a partir das 18:00, uma vez por dia."""
+        if self.dia_atual > self.limpeza_feita_no_dia:
+            self.limpeza_feita_no_dia = -1
+        if self.hora_atual >= HORA_FIM_EXPEDIENTE and self.limpeza_feita_no_dia != self.dia_atual:
+            self.ao_mensagem(f"Acionando rotina de fim de expediente para o Dia {self.dia_atual}.")
+            self.rotina_fim_de_expediente()
+
+    def _novo_dia(self):
+        self.dia_atual += 1
+        self.hora_atual = 0
+        self.gerar_processos_do_dia()
+        self.arquivar_concluidos()
+
+    def avancar_horas(self, horas=1):
+        """Avança o relógio hora a hora (gerando os processos a cada virada de dia) e atualiza os estados."""
+        for _ in range(horas):
+            self.hora_atual += 1
+            if self.hora_atual >= 24:
+                self._novo_dia()
+            self.verificar_eventos_de_horario()
+        self.atualizar_estados()
+
+    def avancar_dia(self):
+        """Fecha o dia atual (fim de expediente, se pendente) e vai para as 00:00 do dia seguinte."""
+        self.verificar_eventos_de_horario()
+        self._novo_dia()
+        self.atualizar_estados()
+
+    def executar_ate(self, dia, hora=0, a_cada_hora=None):
+        """
+        Avança hora a hora até (dia, hora). `a_cada_hora(motor)`, se informado, é chamado depois
+        de cada hora — por exemplo, para simular os movimentadores e as compras.
+        """
+        while (self.dia_atual, self.hora_atual) < (dia, hora):
+            self.avancar_horas(1)
+            if a_cada_hora is not None:
+                a_cada_hora(self)
+        return self
+
+    # --- Ações dos usuários ---
+
+    def movimentar(self, processo, dia_etapa, usuario):
+        """
+        Inicia (primeira chamada) ou confirma (segunda chamada) a movimentação de uma etapa
+        em "Aguardando".
+
+        Returns:
+            str: "iniciada" ou "confirmada".
+
+        Raises:
+            ValueError: Se a etapa não estiver no estado "Aguardando".
+        """
+        day_offset = processo.day_offset(dia_etapa)
+        if day_offset is None or processo.status_etapas[day_offset] != ETAPA_AGUARDANDO:
+            raise ValueError(f"A etapa do Dia {dia_etapa} do processo {processo.numero} não está no estado 'Aguardando'.")
+
+        movimentacao = processo.movimentacao(day_offset)
+        if movimentacao is None:
+            processo.iniciar_movimentacao(day_offset, usuario, self.data_simulada())
+            self.registrar_evento(
+                evento="MOVIMENTAÇÃO INICIADA",
+                filial=processo.filial,
+                sku=processo.sku,
+                process_id=processo.sku_process_number,
+                dia_processo=day_offset,
+                quantidade_kg=processo.quantidade_kg,
+                usuario=usuario,
+                info_adicional=f"Início da movimentação para o dia {day_offset} do ciclo."
+            )
+            return "iniciada"
+
+        processo.status_etapas[day_offset] = ETAPA_FEITA
+        self.etapas_aguardando.pop((processo.sku_process_number, dia_etapa), None)
+        movimentacao.dia_conclusao = self.dia_atual
+        movimentacao.hora_conclusao = self.hora_atual
+        movimentacao.confirmacao_ts = self.data_simulada()
+        self.registrar_evento(
+            evento="MOVIMENTAÇÃO CONFIRMADA",
+            filial=processo.filial,
+            sku=processo.sku,
+            process_id=processo.sku_process_number,
+            dia_processo=day_offset,
+            quantidade_kg=processo.quantidade_kg,
+            usuario=usuario,
+            info_adicional=f"Confirmação da movimentação para o dia {day_offset} do ciclo."
+        )
+
+        if day_offset == processo.days_cycle - 1:
+            self.processos.atualizar(processo, status=STATUS_CONCLUIDO, dia_conclusao=self.dia_atual)
+            concluidos = self.concluidos_por_filial.setdefault(processo.filial, [])
+            if processo.sku_process_number not in concluidos:
+                concluidos.append(processo.sku_process_number)
+                self.ao_mensagem(f"Processo {processo.sku_process_number} (Filial {processo.filial}) concluído no Dia {day_offset}. Adicionado para exibição do abastecedor.")
+
+        # A etapa seguinte entra na agenda e, se o dia dela já chegou, é liberada agora
+        if day_offset + 1 < processo.days_cycle:
+            self._agendar(processo, day_offset + 1)
+            self.atualizar_estados()
+        return "confirmada"
+
+    def concluir_etapas_aguardando(self, usuario):
+        """Inicia e confirma todas as etapas em "Aguardando" (movimentadores simulados, para lotes)."""
+        for (_, dia_etapa), processo in list(self.etapas_aguardando.items()):
+            if processo.movimentacao(dia_etapa - processo.dia_geracao) is None:
+                self.movimentar(processo, dia_etapa, usuario)
+            self.movimentar(processo, dia_etapa, usuario)
+
+    def abastecer(self, process_id, quantidade_kg, usuario):
+        """
+        Leva `quantidade_kg` da estante para o balcão.
+
+        Raises:
+            KeyError: Se o processo não existir.
+            ValueError: Se a quantidade for maior que o estoque da estante.
+        """
+        processo = self.processo(process_id)
+        if processo is None:
+            raise KeyError(process_id)
+        if quantidade_kg > processo.quantidade_kg:
+            raise ValueError(
+                f"A quantidade informada ({quantidade_kg:.2f} kg) é maior que o estoque disponível na estante ({processo.quantidade_kg:.2f} kg)."
+            )
+
+        processo.quantidade_kg -= quantidade_kg
+        processo.peso_no_balcao += quantidade_kg
+        processo.registrar_abastecimento(usuario, self.data_simulada(), quantidade_kg)
+        self.registrar_evento(
+            evento="ABASTECIMENTO",
+            filial=processo.filial,
+            sku=processo.sku,
+            process_id=process_id,
+            dia_processo="N/A", # Abastecimento não tem dia de ciclo
+            quantidade_kg=quantidade_kg, # Loga a quantidade que foi movida
+            usuario=usuario,
+            info_adicional=f"Abastecimento do balcão. Saldo estante: {processo.quantidade_kg:.2f}kg, Saldo balcão: {processo.peso_no_balcao:.2f}kg"
+        )
+        return processo
+
+    def registrar_compra(self, process_id, quantidade_kg):
+        """
+        Registra uma compra (retirada do balcão).
+
+        Raises:
+            KeyError: Se o processo não existir.
+            ValueError: Se o balcão não tiver a quantidade.
+        """
+        processo = self.processo(process_id)
+        if processo is None:
+            raise KeyError(process_id)
+        peso_atual = processo.peso_no_balcao
+        if quantidade_kg > peso_atual:
+            raise ValueError(
+                f"Não é possível retirar {quantidade_kg:.2f} kg.\n"
+                f"O balcão possui apenas {peso_atual:.2f} kg deste processo."
+            )
+        processo.peso_no_balcao -= quantidade_kg
+        return processo